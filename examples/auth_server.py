@@ -26,9 +26,23 @@ class MainHandler(tornado.web.RequestHandler):
             print('Unknow username:', data.get('username'))
 
 
+class BatchHandler(tornado.web.RequestHandler):
+    """Sign a JSON list of requests, used by upyun.AuthServerSigner"""
+
+    def post(self):
+        signatures = []
+        for data in json.loads(self.request.body.decode()):
+            if data.get('username') != USERNAME:
+                raise tornado.web.HTTPError(403)
+            data['password'] = hashlib.md5(PASSWORD.encode()).hexdigest()
+            signatures.append(upyun.make_signature(**data))
+        self.write(json.dumps(signatures))
+
+
 def make_app():
     return tornado.web.Application([
         (r'/', MainHandler),
+        (r'/batch', BatchHandler),
     ])
 
 if __name__ == "__main__":
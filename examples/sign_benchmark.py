@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import os
+import sys
+import timeit
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import upyun
+from upyun.modules.httpipe import cur_dt, httpdate_rfc1123
+
+# 小文件场景下每个请求的签名开销：旧的逐次计算方式与预计算的 Signer 对比
+up = upyun.UpYun('service', username='username', password='password')
+number = 100000
+
+
+def legacy():
+    dt = httpdate_rfc1123(datetime.datetime.utcnow())
+    upyun.make_signature(username=up.username, password=up.password,
+                         method='PUT', uri='/service/path/to/small.txt',
+                         date=dt, content_md5=None)
+
+
+def signer():
+    up.signer.sign('PUT', '/service/path/to/small.txt', cur_dt())
+
+
+def make_request():
+    up.up_rest.make_request('PUT', '/path/to/small.txt', b'0' * 1024)
+
+
+if __name__ == "__main__":
+    for name, func in (('legacy sign', legacy), ('Signer.sign', signer),
+                       ('make_request', make_request)):
+        seconds = min(timeit.repeat(func, number=number, repeat=3))
+        print('%-14s %10.0f requests/sec' % (name, number / seconds))
@@ -35,7 +35,7 @@ setup(
     url='https://github.com/upyun/python-sdk',
     packages=['upyun', 'upyun.modules'],
     keywords=['upyun', 'python', 'sdk'],
-    install_requires=['requests>=2.4.3'],
+    install_requires=['requests>=2.4.3', 'futures; python_version < "3"'],
     classifiers=[
         'Development Status :: 5 - Production/Stable',
         'Intended Audience :: Developers',
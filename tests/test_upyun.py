@@ -3,6 +3,7 @@ from upyun import FileStore
 import upyun
 import io
 import os
+import shutil
 import sys
 import time
 import types
@@ -71,8 +72,67 @@ class TestUpYun(unittest.TestCase):
         up = upyun.UpYun(SERVICE, USERNAME, PASSWORD,
                          endpoint=upyun.ED_AUTO, debug=True)
         up.getinfo('/')
+        up.hp.debug.flush()
+        with open('debug.log') as f:
+            content = f.read()
+        self.assertIn('## Http responds ##', content)
+        self.assertNotIn(up.password, content)
         os.remove('debug.log')
 
+    def test_bandwidth(self):
+        bandwidth = upyun.BandwidthLimiter(upload=256 * 1024,
+                                           download=256 * 1024)
+        up = upyun.UpYun(SERVICE, USERNAME, PASSWORD, endpoint=upyun.ED_AUTO,
+                         bandwidth=bandwidth)
+        data = b'x' * 768 * 1024
+        start = time.time()
+        up.put(self.root + 'bandwidth.txt', io.BytesIO(data))
+        self.assertGreaterEqual(time.time() - start, 1)
+        f = io.BytesIO()
+        start = time.time()
+        up.get(self.root + 'bandwidth.txt', f)
+        self.assertGreaterEqual(time.time() - start, 1)
+        self.assertEqual(f.getvalue(), data)
+        # 转存的分块只按上传限速一次, 1M/s 时 3M 约需 2 秒(首秒为突发额度)
+        up = upyun.UpYun(SERVICE, USERNAME, PASSWORD, endpoint=upyun.ED_AUTO,
+                         bandwidth=upyun.BandwidthLimiter(upload=1024 * 1024))
+        self.up.put(self.root + 'bandwidth.txt', b'x' * 3 * 1024 * 1024)
+        start = time.time()
+        up.transfer(self.up, self.root + 'bandwidth.txt',
+                    self.root + 'bandwidth-to.txt', workers=3,
+                    part_size=1024 * 1024)
+        elapsed = time.time() - start
+        self.assertGreaterEqual(elapsed, 1.5)
+        self.assertLess(elapsed, 4)
+        self.delete(self.root + 'bandwidth-to.txt')
+        self.delete(self.root + 'bandwidth.txt')
+
+    def test_debug_log_rotate(self):
+        log = upyun.DebugLog('debug-test.log', max_bytes=4096, backup_count=1,
+                             max_body=16)
+        up = upyun.UpYun(SERVICE, USERNAME, PASSWORD,
+                         endpoint=upyun.ED_AUTO, debug=log)
+        for _ in range(20):
+            up.put(self.root + 'debug.txt', 'x' * 1024)
+        log.close()
+        self.assertTrue(os.path.exists('debug-test.log.1'))
+        self.assertFalse(os.path.exists('debug-test.log.2'))
+        with open('debug-test.log.1') as f:
+            self.assertNotIn('x' * 17, f.read())
+        os.remove('debug-test.log.1')
+        if os.path.exists('debug-test.log'):
+            os.remove('debug-test.log')
+
+    def test_pool_config(self):
+        up = upyun.UpYun(SERVICE, USERNAME, PASSWORD, endpoint=upyun.ED_AUTO,
+                         pool_connections=2, pool_maxsize=32, pool_block=True,
+                         max_retries=2)
+        adapter = up.hp.session.get_adapter('http://' + upyun.ED_AUTO)
+        self.assertEqual(adapter._pool_maxsize, 32)
+        self.assertEqual(adapter._pool_block, True)
+        self.assertEqual(adapter.max_retries.total, 2)
+        up.getinfo('/')
+
     def test_auth_failed(self):
         with self.assertRaises(upyun.UpYunServiceException) as se:
             upyun.UpYun('service', 'username', 'password').getinfo('/')
@@ -85,6 +145,54 @@ class TestUpYun(unittest.TestCase):
             e.up_rest.endpoint = 'e.api.upyun.com'
             e.getinfo('/')
 
+    def test_retry_policy(self):
+        delays = []
+        retry = upyun.RetryPolicy(retries=2, backoff=0.1, sleep=delays.append)
+        up = upyun.UpYun(SERVICE, USERNAME, PASSWORD, retry=retry)
+        up.up_rest.endpoint = 'e.api.upyun.com'
+        with self.assertRaises(upyun.UpYunClientException):
+            up.getinfo('/')
+        self.assertEqual(len(delays), 2)
+        self.assertTrue(all(0 <= d <= 0.2 for d in delays))
+        del delays[:]
+        with self.assertRaises(upyun.UpYunClientException):
+            up.mkdir(self.root + 'retry')
+        self.assertEqual(delays, [])
+        with self.assertRaises(upyun.UpYunClientException):
+            up.move(self.root + 'retry', self.root + 'retry-moved')
+        self.assertEqual(delays, [])
+        up = upyun.UpYun(SERVICE, USERNAME, PASSWORD)
+        self.assertEqual(up.hp.retry.retries, 0)
+        up = upyun.UpYun(SERVICE, USERNAME, PASSWORD, retry=False)
+        self.assertEqual(up.hp.retry.retries, 0)
+        up = upyun.UpYun(SERVICE, USERNAME, PASSWORD,
+                         retry=upyun.RetryPolicy(retries=0,
+                                                 sleep=delays.append))
+        up.up_rest.endpoint = 'e.api.upyun.com'
+        uploader = up.init_multi_uploader(self.root + 'retry',
+                                          upload_id=str(uuid.uuid4()))
+        with self.assertRaises(upyun.UpYunClientException):
+            uploader.upload_part(0, b'x', retries=5)
+        self.assertEqual(delays, [])
+
+    def test_hooks(self):
+        events = []
+        metrics = upyun.MetricsSink()
+        up = upyun.UpYun(SERVICE, USERNAME, PASSWORD, endpoint=upyun.ED_AUTO,
+                         hooks=[events.append, metrics, upyun.LoggingSink()])
+        up.hp.add_hook(lambda event: 1 / 0)
+        up.put(self.root + 'hooks.txt', 'hello')
+        up.getinfo(self.root + 'hooks.txt')
+        up.delete(self.root + 'hooks.txt')
+        self.assertEqual([e.method for e in events], ['PUT', 'HEAD', 'DELETE'])
+        self.assertEqual(events[0].status, 200)
+        self.assertEqual(events[0].bytes_sent, 5)
+        self.assertEqual(events[0].attempt, 0)
+        self.assertTrue(events[0].request_id)
+        self.assertTrue(0 <= events[0].ttfb <= events[0].elapsed)
+        self.assertIn('upyun_requests_total{method="PUT",status="200"} 1',
+                      metrics.render())
+
     def test_root(self):
         res = self.up.getinfo('/')
         self.assertTrue(res.get('file-type') == 'folder')
@@ -174,8 +282,9 @@ class TestUpYun(unittest.TestCase):
             f.write(uuid.uuid4().hex)
         with open('tests/resume.txt', 'rb') as f:
             before = upyun.make_content_md5(f)
-            self.up.put(self.root + 'resume.txt',
-                        f, checksum=True, need_resume=True)
+            res = self.up.put(self.root + 'resume.txt',
+                              f, checksum=True, need_resume=True)
+        self.assertIsInstance(res, dict)
         with open('tests/get.txt', 'wb') as f:
             self.up.get(self.root + 'resume.txt', f)
         with open('tests/get.txt', 'rb') as f:
@@ -228,6 +337,212 @@ class TestUpYun(unittest.TestCase):
         self.assertEqual(parts[0]["id"], 0)
         self.assertEqual(parts[1]["id"], 2)
 
+    def test_upload_file(self):
+        with open('tests/upload_file.txt', 'w') as f:
+            f.seek(5 * 1024 * 1024)
+            f.write(uuid.uuid4().hex)
+        with open('tests/upload_file.txt', 'rb') as f:
+            before = upyun.make_content_md5(f)
+        self.up.upload_file('tests/upload_file.txt',
+                            self.root + 'upload_file.txt', workers=3)
+        with open('tests/get.txt', 'wb') as f:
+            self.up.get(self.root + 'upload_file.txt', f)
+        with open('tests/get.txt', 'rb') as f:
+            after = upyun.make_content_md5(f)
+        self.assertEqual(before, after)
+        os.remove('tests/get.txt')
+        os.remove('tests/upload_file.txt')
+        self.delete(self.root + 'upload_file.txt')
+
+    def test_upload_mmap(self):
+        from upyun.multi import map_file, close_map
+        with open('tests/mmap.txt', 'wb') as f:
+            f.write(os.urandom(3 * 1024 * 1024 + 7))
+        with open('tests/mmap.txt', 'rb') as f:
+            before = upyun.make_content_md5(f)
+            mapped = map_file(f)
+            if sys.version_info[0] == 3:
+                self.assertIsNotNone(mapped)
+                close_map(mapped)
+            else:
+                self.assertIsNone(mapped)
+            self.up.put(self.root + 'mmap-resume.txt', f, checksum=True,
+                        need_resume=True, part_size=1024 * 1024)
+        self.up.upload_file('tests/mmap.txt', self.root + 'mmap-multi.txt',
+                            workers=2, part_size=1024 * 1024)
+        for key in ('mmap-resume.txt', 'mmap-multi.txt'):
+            with open('tests/get.txt', 'wb') as f:
+                self.up.get(self.root + key, f)
+            with open('tests/get.txt', 'rb') as f:
+                self.assertEqual(before, upyun.make_content_md5(f))
+            self.delete(self.root + key)
+        os.remove('tests/get.txt')
+        os.remove('tests/mmap.txt')
+
+    def test_part_size_auto(self):
+        from upyun.modules.tuning import choose_part_size, MB
+        self.assertEqual(choose_part_size(100), MB)
+        self.assertEqual(choose_part_size(100 * MB), MB)
+        self.assertEqual(choose_part_size(50 * 1024 * MB), 50 * MB)
+        self.assertEqual(choose_part_size(100 * MB, throughput=10 * MB),
+                         20 * MB)
+        with self.assertRaises(upyun.UpYunClientException):
+            choose_part_size(20 * 1024 * MB, part_size=MB)
+        with self.assertRaises(upyun.UpYunClientException):
+            choose_part_size(600 * 1024 * MB)
+
+        warm = upyun.modules.tuning.ThroughputMeter()
+        warm.update(50 * MB, 1)
+        self.assertEqual(choose_part_size(6 * MB, warm, workers=4), MB)
+        self.assertEqual(choose_part_size(100 * MB, 25 * MB), 25 * MB)
+        self.assertEqual(choose_part_size(10 * MB, 5 * MB), 2 * MB)
+        self.assertEqual(choose_part_size(64 * MB, warm, workers='auto',
+                                          max_workers=10), 6 * MB)
+
+        up = upyun.UpYun(SERVICE, USERNAME, PASSWORD, endpoint=upyun.ED_AUTO)
+        up.up_rest.throughput.update(50 * MB, 1)
+        with open('/tmp/up-part-size', 'wb') as f:
+            f.write(os.urandom(6 * MB))
+        with open('/tmp/up-part-size', 'rb') as f:
+            resumer = upyun.resume.UpYunResume(up.up_rest, self.root + 'x',
+                                               f, 6 * MB, workers=4)
+            self.assertTrue(resumer.disorder)
+            self.assertEqual(resumer.part_size, MB)
+        # 'auto' 的并发数上限为连接池大小(默认 10)
+        with open('/tmp/up-part-size', 'wb') as f:
+            f.seek(64 * MB - 1)
+            f.write(b'x')
+        with open('/tmp/up-part-size', 'rb') as f:
+            resumer = upyun.resume.UpYunResume(up.up_rest, self.root + 'x',
+                                               f, 64 * MB, workers='auto')
+            self.assertEqual(resumer.part_size, 6 * MB)
+        up.up_rest.throughput.rate = 4 * MB
+        with open('/tmp/up-part-size', 'wb') as f:
+            f.write(os.urandom(10 * MB))
+        with open('/tmp/up-part-size', 'rb') as f:
+            up.put(self.root + 'part-size.bin', f, need_resume=True)
+        res = up.getinfo(self.root + 'part-size.bin')
+        self.assertEqual(res['file-size'], str(10 * MB))
+        self.delete(self.root + 'part-size.bin')
+        os.remove('/tmp/up-part-size')
+
+    def test_put_stream(self):
+        with open('tests/test.png', 'rb') as f:
+            data = f.read()
+        resp = requests.get('http://%s.b0.upaiyun.com/' % SERVICE,
+                            stream=True)
+        self.up.put(self.root + 'stream.html', resp)
+        r, w = os.pipe()
+        with os.fdopen(w, 'wb') as fw:
+            fw.write(data)
+        with os.fdopen(r, 'rb') as fr:
+            self.up.put(self.root + 'pipe.png', fr)
+        res = self.up.getinfo(self.root + 'pipe.png')
+        self.assertEqual(res['file-size'], str(len(data)))
+        self.delete(self.root + 'stream.html')
+        self.delete(self.root + 'pipe.png')
+
+    def test_transfer(self):
+        with open('tests/transfer.txt', 'w') as f:
+            f.seek(3 * 1024 * 1024)
+            f.write(uuid.uuid4().hex)
+        with open('tests/transfer.txt', 'rb') as f:
+            before = upyun.make_content_md5(f)
+            self.up.put(self.root + 'transfer.txt', f)
+        self.up.transfer(self.up, self.root + 'transfer.txt',
+                         self.root + 'transfer-to.txt', workers=3)
+        self.up.put_from_url(self.root + 'url.png',
+                             'http://%s.b0.upaiyun.com%stransfer.txt'
+                             % (SERVICE, self.root))
+        for key in ('transfer-to.txt', 'url.png'):
+            with open('tests/get.txt', 'wb') as f:
+                self.up.get(self.root + key, f)
+            with open('tests/get.txt', 'rb') as f:
+                self.assertEqual(before, upyun.make_content_md5(f))
+            self.delete(self.root + key)
+        os.remove('tests/get.txt')
+        os.remove('tests/transfer.txt')
+        self.delete(self.root + 'transfer.txt')
+
+    def test_put_checksum_large(self):
+        with open('tests/checksum.txt', 'w') as f:
+            f.seek(6 * 1024 * 1024)
+            f.write(uuid.uuid4().hex)
+        with open('tests/checksum.txt', 'rb') as f:
+            before = upyun.make_content_md5(f)
+            res = self.up.put(self.root + 'checksum.txt', f, checksum=True)
+        size = str(os.path.getsize('tests/checksum.txt'))
+        self.assertEqual(res['content-length'], size)
+        with open('tests/checksum.txt', 'rb') as f:
+            res = self.up.put_multi(self.root + 'checksum.txt', f)
+        self.assertIsInstance(res, dict)
+        res = self.up.getinfo(self.root + 'checksum.txt')
+        self.assertEqual(res['file-size'], size)
+        with open('tests/get.txt', 'wb') as f:
+            self.up.get(self.root + 'checksum.txt', f)
+        with open('tests/get.txt', 'rb') as f:
+            self.assertEqual(before, upyun.make_content_md5(f))
+        # 从当前位置开始计算 MD5 及上传
+        with open('tests/checksum.txt', 'rb') as f:
+            f.read(10)
+            res = self.up.put(self.root + 'checksum.txt', f, checksum=True)
+        self.assertEqual(res['content-length'], str(int(size) - 10))
+        os.remove('tests/get.txt')
+        os.remove('tests/checksum.txt')
+        self.delete(self.root + 'checksum.txt')
+
+    def test_get_parallel(self):
+        with open('tests/get_parallel.txt', 'w') as f:
+            f.seek(3 * 1024 * 1024)
+            f.write(uuid.uuid4().hex)
+        with open('tests/get_parallel.txt', 'rb') as f:
+            before = upyun.make_content_md5(f)
+            self.up.put(self.root + 'get_parallel.txt', f)
+        with open('tests/get.txt', 'wb') as f:
+            self.up.get(self.root + 'get_parallel.txt', f, workers=3,
+                        part_size=1024 * 1024, checksum=True)
+        with open('tests/get.txt', 'rb') as f:
+            after = upyun.make_content_md5(f)
+        self.assertEqual(before, after)
+        os.remove('tests/get.txt')
+        os.remove('tests/get_parallel.txt')
+        self.delete(self.root + 'get_parallel.txt')
+
+    def test_get_resume(self):
+        with open('tests/get_resume.txt', 'w') as f:
+            f.seek(3 * 1024 * 1024)
+            f.write(uuid.uuid4().hex)
+        with open('tests/get_resume.txt', 'rb') as f:
+            before = upyun.make_content_md5(f)
+            self.up.put(self.root + 'get_resume.txt', f)
+        progress = []
+
+        class Handler(object):
+            def __init__(self, totalsize, params):
+                progress.append(totalsize)
+
+            def update(self, readsofar):
+                progress.append(readsofar)
+
+            def finish(self):
+                progress.append('done')
+
+        with open('tests/get.txt', 'ab') as f:
+            self.up.get(self.root + 'get_resume.txt', f, need_resume=True,
+                        store=FileStore(), part_size=1024 * 1024,
+                        handler=Handler)
+        with open('tests/get.txt', 'rb') as f:
+            after = upyun.make_content_md5(f)
+        self.assertEqual(before, after)
+        self.assertEqual(progress[0], 3 * 1024 * 1024 + 32)
+        self.assertEqual(progress[-1], 'done')
+        with open('tests/get.txt', 'ab') as f:
+            with self.assertRaises(upyun.UpYunClientException):
+                self.up.get(self.root + 'get_resume.txt', f, workers=2)
+        os.remove('tests/get.txt')
+        os.remove('tests/get_resume.txt')
+        self.delete(self.root + 'get_resume.txt')
+
     def test_resume_small(self):
         with open('tests/small-resume.txt', 'w') as f:
             f.seek(300 * 1024)
@@ -269,6 +584,28 @@ class TestUpYun(unittest.TestCase):
             self.up.getinfo(self.root + 'resume_store.txt')
         self.assertEqual(se.exception.status, 404)
 
+    def test_resume_parallel(self):
+        with open('tests/resume_parallel.txt', 'w') as f:
+            f.seek(15 * 1024 * 1024)
+            f.write(uuid.uuid4().hex)
+        with open('tests/resume_parallel.txt', 'rb') as f:
+            before = upyun.make_content_md5(f)
+            res = self.up.put(self.root + 'resume_parallel.txt', f,
+                              checksum=True, need_resume=True,
+                              store=FileStore(), workers=4)
+        self.assertIsInstance(res, dict)
+        with open('tests/get.txt', 'wb') as f:
+            self.up.get(self.root + 'resume_parallel.txt', f)
+        with open('tests/get.txt', 'rb') as f:
+            after = upyun.make_content_md5(f)
+        self.assertEqual(before, after)
+        os.remove('tests/get.txt')
+        os.remove('tests/resume_parallel.txt')
+        self.delete(self.root + 'resume_parallel.txt')
+        with self.assertRaises(upyun.UpYunServiceException) as se:
+            self.up.getinfo(self.root + 'resume_parallel.txt')
+        self.assertEqual(se.exception.status, 404)
+
     def test_mkdir(self):
         self.up.mkdir(self.root + 'test')
         res = self.up.getinfo(self.root + 'test')
@@ -300,17 +637,31 @@ class TestUpYun(unittest.TestCase):
         for line in lines:
             if line['type'] == 'F':
                 self.assertEqual(line['name'], 'test')
-                self.assertEqual(line['size'], '0')
+                self.assertEqual(line['size'], 0)
             else:
                 self.assertEqual(line['type'], 'N')
-                self.assertEqual(line['name'], 'test.png')
-                self.assertEqual(line['size'], '13001')
+                self.assertEqual(line.name, 'test.png')
+                self.assertEqual(line.size, 13001)
         self.delete(self.root + 'test')
         self.delete(self.root + 'test.png')
         with self.assertRaises(upyun.UpYunServiceException) as se:
             self.up.getlist(self.root + 'test')
         self.assertEqual(se.exception.status, 404)
 
+    def test_walk(self):
+        self.up.mkdir(self.root + 'walk/a/b')
+        for key in ('walk/1.txt', 'walk/a/2.txt', 'walk/a/b/3.txt'):
+            self.up.put(self.root + key, 'walk')
+        paths = sorted(path for path, item in
+                       self.up.walk(self.root + 'walk', workers=3, limit=1)
+                       if item['type'] != 'F')
+        self.assertEqual(paths, [self.root + 'walk/1.txt',
+                                 self.root + 'walk/a/2.txt',
+                                 self.root + 'walk/a/b/3.txt'])
+        for key in ('walk/1.txt', 'walk/a/2.txt', 'walk/a/b/3.txt',
+                    'walk/a/b', 'walk/a', 'walk'):
+            self.delete(self.root + key)
+
     def test_delete(self):
         self.up.mkdir(self.root + 'test')
         with open('tests/test.png', 'rb') as f:
@@ -324,6 +675,138 @@ class TestUpYun(unittest.TestCase):
             self.up.getinfo(self.root + 'test')
         self.assertEqual(se.exception.status, 404)
 
+    def test_delete_many(self):
+        keys = [self.root + 'test-%d.txt' % i for i in range(5)]
+        for key in keys:
+            self.up.put(key, 'delete')
+        report = self.up.delete_many(keys + [self.root + 'missing.txt'],
+                                     workers=3)
+        self.assertEqual(len(report), 6)
+        for key in keys:
+            self.assertIsNone(report[key])
+        self.assertEqual(report[self.root + 'missing.txt'].status, 404)
+
+    def test_concurrency_auto(self):
+        now = [0.0]
+        controller = upyun.ConcurrencyController(
+            initial=2, max_workers=4, cooldown=1, timer=lambda: now[0])
+        for _ in range(2):
+            now[0] += 1
+            controller.on_success()
+        self.assertEqual(controller.workers, 3)
+        controller.on_result(upyun.UpYunServiceException(
+            None, 503, 'Service Unavailable', None))
+        controller.on_result(upyun.UpYunServiceException(
+            None, 429, 'Too Many Requests', None))
+        self.assertEqual(controller.workers, 1)
+        controller.on_result(upyun.UpYunServiceException(
+            None, 404, 'Not Found', None))
+        self.assertEqual(controller.workers, 1)
+
+        keys = [self.root + 'auto-%d.txt' % i for i in range(5)]
+        for key in keys:
+            self.up.put(key, 'auto')
+        controller = upyun.ConcurrencyController()
+        report = self.up.delete_many(keys, workers=controller)
+        self.assertEqual(report, dict.fromkeys(keys))
+        self.assertNotIn(controller, self.up.up_rest.hp.hooks)
+        self.assertIn(controller.workers, range(1, 33))
+        # 共享控制器时, 最后一个任务结束才注销
+        rest = self.up.up_rest
+        first = rest.concurrency(controller)
+        second = rest.concurrency(controller)
+        first.__enter__()
+        second.__enter__()
+        self.assertEqual(rest.hp.hooks.count(controller), 1)
+        first.__exit__(None, None, None)
+        self.assertIn(controller, rest.hp.hooks)
+        second.__exit__(None, None, None)
+        self.assertNotIn(controller, rest.hp.hooks)
+        rest.hp.add_hook(controller)
+        with rest.concurrency(controller):
+            pass
+        self.assertIn(controller, rest.hp.hooks)
+        rest.hp.hooks.remove(controller)
+
+        from upyun.modules.parallel import get_controller
+        self.assertEqual(self.up.hp.pool_maxsize, 10)
+        controller = get_controller('auto', self.up.hp.pool_maxsize)
+        self.assertEqual(controller.max_workers, 10)
+        self.assertEqual(get_controller('auto', 1).workers, 1)
+
+    def test_getinfo_many(self):
+        keys = [self.root + 'info-%d.txt' % i for i in range(3)]
+        for key in keys:
+            self.up.put(key, 'info')
+        cache = upyun.TTLCache()
+        infos = self.up.getinfo_many(keys + [self.root + 'missing.txt'],
+                                     workers=3, cache=cache)
+        for key in keys:
+            self.assertEqual(infos[key]['file-size'], '4')
+        self.assertIsNone(infos[self.root + 'missing.txt'])
+        self.assertEqual(self.up.getinfo_many(keys, cache=cache),
+                         dict((k, infos[k]) for k in keys))
+        self.assertEqual(cache.hits, 3)
+        self.up.delete_many(keys)
+
+    def test_cache(self):
+        up = upyun.UpYun(SERVICE, USERNAME, PASSWORD, timeout=100,
+                         cache=True)
+        up.put(self.root + 'cache.txt', 'cache')
+        self.assertEqual(up.getinfo(self.root + 'cache.txt')['file-size'],
+                         '5')
+        self.assertEqual(len(up.getlist(self.root)), 1)
+        up.getinfo(self.root + 'cache.txt')
+        up.getlist(self.root)
+        self.assertEqual(up.cache.hits, 2)
+        up.put(self.root + 'cache.txt', 'cache2')
+        self.assertEqual(up.getinfo(self.root + 'cache.txt')['file-size'],
+                         '6')
+        up.move(self.root + 'cache.txt', self.root + 'cache2.txt')
+        self.assertEqual([x['name'] for x in up.getlist(self.root)],
+                         ['cache2.txt'])
+        up.delete(self.root + 'cache2.txt')
+        self.assertEqual(up.getlist(self.root), [])
+        hits = up.cache.hits
+        up.getlist(self.root, limit=10)
+        self.assertEqual(up.cache.hits, hits)
+        with open('tests/test.png', 'rb') as f:
+            up.put(self.root + 'form.png', f, form=True)
+        self.assertEqual([x['name'] for x in up.getlist(self.root)],
+                         ['form.png'])
+        self.assertEqual(up.getinfo(self.root + 'form.png')['file-size'],
+                         str(os.path.getsize('tests/test.png')))
+        up.delete(self.root + 'form.png')
+
+    def test_sync(self):
+        os.makedirs('tests/sync/sub')
+        for name in ('a.txt', 'sub/b.txt'):
+            with open('tests/sync/' + name, 'w') as f:
+                f.write(uuid.uuid4().hex)
+        report = self.up.sync('tests/sync', self.root + 'sync', workers=3)
+        self.assertEqual(sorted(report['uploaded']), ['a.txt', 'sub/b.txt'])
+        report = self.up.sync('tests/sync', self.root + 'sync')
+        self.assertEqual(report['uploaded'], [])
+        self.assertEqual(report['skipped'], 2)
+
+        os.makedirs('tests/sync_down')
+        report = self.up.sync('tests/sync_down', self.root + 'sync',
+                              direction='download', checksum=True)
+        self.assertEqual(sorted(report['downloaded']),
+                         ['a.txt', 'sub/b.txt'])
+        with open('tests/sync/sub/b.txt') as f1:
+            with open('tests/sync_down/sub/b.txt') as f2:
+                self.assertEqual(f1.read(), f2.read())
+
+        os.remove('tests/sync/a.txt')
+        report = self.up.sync('tests/sync', self.root + 'sync', delete=True)
+        self.assertEqual(report['deleted'], ['a.txt'])
+        shutil.rmtree('tests/sync')
+        shutil.rmtree('tests/sync_down')
+        self.delete(self.root + 'sync/sub/b.txt')
+        self.delete(self.root + 'sync/sub')
+        self.delete(self.root + 'sync')
+
     def test_put_with_gmkerl(self):
         headers = {'x-gmkerl-rotate': '90'}
         with open('tests/test.png', 'rb') as f:
@@ -366,6 +849,27 @@ class TestUpYun(unittest.TestCase):
             self.up.getinfo(self.root + 'test.png')
         self.assertEqual(se.exception.status, 404)
 
+    def test_upload_object_rewind(self):
+        progress = []
+
+        class Handler(object):
+            def __init__(self, totalsize, params):
+                progress.append(('init', totalsize))
+
+            def update(self, readsofar):
+                progress.append(readsofar)
+
+            def finish(self):
+                progress.append('done')
+
+        from upyun.rest import UploadObject
+        body = UploadObject(io.BytesIO(b'x' * 10), chunksize=4,
+                            handler=Handler)
+        self.assertEqual(b''.join(body), b'x' * 10)
+        body.seek(0)
+        self.assertEqual(b''.join(body), b'x' * 10)
+        self.assertEqual(progress, [('init', 10), 4, 8, 'done'] * 2)
+
     def test_purge(self):
         res = self.up.purge('/test.png')
         self.assertListEqual(res, [])
@@ -374,6 +878,16 @@ class TestUpYun(unittest.TestCase):
         res = self.up.purge('/test.png', 'invalid.upyun.com')
         self.assertListEqual(res, [u'/test.png'])
 
+    def test_purge_queue(self):
+        keys = ['/test/purge/%d.png' % i for i in range(5)]
+        with self.up.purge_queue(batch_size=2, rate=5) as queue:
+            queue.submit(keys)
+            queue.submit(keys[0])
+        self.assertListEqual(queue.invalid, [])
+        self.assertDictEqual(queue.failed, {})
+        with self.assertRaises(upyun.UpYunClientException):
+            queue.submit('/test.png')
+
     def test_filelike_object_flask(self):
         class ProgressBarHandler(object):
             def __init__(self, totalsize, params):
@@ -474,6 +988,30 @@ class TestUpYun(unittest.TestCase):
             self.up.getinfo(self.root + 'test.mp4')
         self.assertEqual(se.exception.status, 404)
 
+    def test_async_client(self):
+        try:
+            import asyncio
+            import aiohttp  # noqa
+        except ImportError:
+            self.skipTest('aiohttp not installed')
+
+        async def run():
+            async with upyun.AsyncUpYun(SERVICE, USERNAME, PASSWORD,
+                                        timeout=100) as up:
+                await up.put(self.root + 'async.txt', 'async')
+                res = await up.get(self.root + 'async.txt')
+                self.assertEqual(res, 'async')
+                res = await up.getinfo(self.root + 'async.txt')
+                self.assertEqual(res['file-size'], '5')
+                lines = [line async for line in up.iterlist(self.root)]
+                self.assertEqual(lines[0]['name'], 'async.txt')
+                await up.delete(self.root + 'async.txt')
+                with self.assertRaises(upyun.UpYunServiceException) as se:
+                    await up.getinfo(self.root + 'async.txt')
+                self.assertEqual(se.exception.status, 404)
+
+        asyncio.get_event_loop().run_until_complete(run())
+
     def test_make_signature(self):
         headers = {
             'Date': 'Fri, 20 Jan 2017 08:46:20 GMT',
@@ -490,7 +1028,27 @@ class TestUpYun(unittest.TestCase):
                                  date=headers['Date'],
                                  content_md5=headers['Content-MD5']))
 
+    def test_signer(self):
+        signer = upyun.Signer('upyun', '4758a92de3f4dd368c01e0dad8578481')
+        self.assertEqual(
+            'UPYUN upyun:kfIIHZ+vY9qwp+cZXE2m7jGWzcE=',
+            signer.sign('POST', '/api/v1/echo',
+                        'Fri, 20 Jan 2017 08:46:20 GMT',
+                        content_md5='d36489794822f8d33fd28217d8a5bed4'))
+        up = upyun.UpYun(SERVICE, signer=upyun.Signer(USERNAME,
+                                                      self.up.password))
+        up.getinfo('/')
+
     def test_auth_server(self):
         up = upyun.UpYun(SERVICE, USERNAME,
                          auth_server='http://localhost:8080')
         up.getinfo('/')
+
+    def test_auth_server_batch(self):
+        signer = upyun.AuthServerSigner(
+            'http://localhost:8080/', batch_url='http://localhost:8080/batch')
+        up = upyun.UpYun(SERVICE, USERNAME, auth_server=signer)
+        report = up.delete_many([self.root + 'batch-%d' % i
+                                 for i in range(10)], workers=5)
+        for exc in report.values():
+            self.assertEqual(exc.status, 404)
@@ -1,10 +1,23 @@
 # -*- coding: utf-8 -*-
 
-from .modules.sign import make_content_md5, make_signature
+from .modules.sign import make_content_md5, make_signature, \
+    AuthServerSigner, Signer
 from .resume import FileStore, BaseStore, BaseReporter, print_reporter
 from .modules.exception import UpYunServiceException, UpYunClientException
+from .modules.cache import TTLCache
+from .modules.retry import RetryPolicy
+from .modules.debuglog import DebugLog
+from .modules.ratelimit import BandwidthLimiter
+from .modules.parallel import ConcurrencyController
+from .modules.hooks import RequestEvent, LoggingSink, MetricsSink, \
+    OpenTelemetrySink
 from .upyun import UpYun, ED_AUTO, ED_TELECOM, ED_CNC, ED_CTT
 
+try:  # Python 3.6+
+    from .aio import AsyncUpYun
+except (ImportError, SyntaxError):
+    AsyncUpYun = None
+
 # Set default logging handler to avoid "No handler found" warnings.
 import logging
 try:  # Python 2.7+
@@ -21,10 +34,13 @@ __license__ = 'MIT License: http://www.opensource.org/licenses/mit-license.php'
 __copyright__ = 'Copyright 2015 UPYUN'
 
 __all__ = [
-    'UpYun', 'UpYunServiceException', 'UpYunClientException',
+    'UpYun', 'AsyncUpYun', 'UpYunServiceException', 'UpYunClientException',
     'ED_AUTO', 'ED_TELECOM', 'ED_CNC', 'ED_CTT', '__version__',
     'make_signature', 'make_content_md5', 'FileStore', 'BaseStore',
-    'BaseReporter', 'print_reporter', 'add_stderr_logger'
+    'BaseReporter', 'print_reporter', 'add_stderr_logger',
+    'AuthServerSigner', 'Signer', 'TTLCache', 'RetryPolicy', 'RequestEvent',
+    'LoggingSink', 'MetricsSink', 'OpenTelemetrySink', 'DebugLog',
+    'BandwidthLimiter', 'ConcurrencyController'
 ]
 
 logging.getLogger(__name__).addHandler(NullHandler())
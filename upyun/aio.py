@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import functools
+import hashlib
+import os
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .rest import UpYunRest, ListEntry, PURGE_HOST, LIST_LIMIT, \
+    LIST_ITER_EOF
+from .av import AvPretreatment
+from .upyun import ED_AUTO, DEFAULT_CHUNKSIZE
+from .modules.compat import b, str
+from .modules.exception import UpYunServiceException, UpYunClientException
+from .modules.httpipe import set_default_headers
+from .modules.ratelimit import ThrottledReader
+from .modules.sign import make_content_md5, Signer
+
+
+async def throttle(bucket, nbytes):
+    """异步等待令牌, 不阻塞事件循环"""
+    if bucket is not None and nbytes:
+        wait = bucket.reserve(nbytes)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class AsyncUpYunHttp(object):
+    def __init__(self, timeout, session=None, limit=100, bandwidth=None):
+        if aiohttp is None:
+            raise UpYunClientException('AsyncUpYun requires aiohttp')
+        if isinstance(timeout, tuple):
+            connect_timeout, read_timeout = timeout
+        else:
+            connect_timeout = read_timeout = timeout
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout,
+                                             sock_read=read_timeout)
+        self.limit = limit
+        self.session = session
+        self.bandwidth = bandwidth
+
+    def get_session(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.limit)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    async def do_http_pipe(self, method, host, uri, value=None, headers=None):
+        url = 'http://%s%s' % (host, uri)
+        headers = set_default_headers(headers or {})
+        if self.bandwidth is not None and self.bandwidth.upload is not None:
+            if hasattr(value, 'read'):
+                value = self.iter_throttled(value)
+            elif value and isinstance(value, (bytes, bytearray, memoryview)):
+                headers['Content-Length'] = str(memoryview(value).nbytes)
+                value = self.iter_throttled(ThrottledReader(value, None))
+        try:
+            resp = await self.get_session().request(
+                method, url, data=value, headers=headers,
+                timeout=self.timeout)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise UpYunClientException(e)
+
+        if resp.status // 100 != 2:
+            try:
+                err = await resp.text()
+            finally:
+                resp.release()
+            raise UpYunServiceException(
+                resp.headers.get('X-Request-Id', 'Unknown'), resp.status,
+                resp.reason or 'Unknown', err, list(resp.headers.items()))
+        return resp
+
+    async def iter_throttled(self, fileobj):
+        while True:
+            chunk = fileobj.read(DEFAULT_CHUNKSIZE)
+            if not chunk:
+                break
+            await throttle(self.bandwidth.upload, len(chunk))
+            yield chunk
+
+    async def throttle_download(self, nbytes):
+        if self.bandwidth is not None:
+            await throttle(self.bandwidth.download, nbytes)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class AsyncUpYun(object):
+    """基于 asyncio 的 UpYun 客户端, 依赖 aiohttp
+
+    >>> async with AsyncUpYun('service', 'username', 'password') as up:
+    >>>     await up.put('/path/to/bar.txt', 'bar')
+    """
+
+    def __init__(self, service, username=None, password=None,
+                 auth_server=None, timeout=None, endpoint=None,
+                 chunksize=None, read_timeout=None, encrypt_pwd=None,
+                 session=None, limit=100, signer=None, bandwidth=None):
+        service = service or os.getenv('UPYUN_SERVICE')
+        if signer is not None:
+            username, password = signer.username, signer.password
+            auth_server = signer.auth_server
+        else:
+            username = username or os.getenv('UPYUN_USERNAME')
+            password = password or os.getenv('UPYUN_PASSWORD')
+            password = (hashlib.md5(b(password)).hexdigest()
+                        if password else encrypt_pwd)
+            signer = Signer(username, password, auth_server)
+        self.auth_server = auth_server
+        self.chunksize = chunksize or DEFAULT_CHUNKSIZE
+        timeout = timeout or 60
+        if read_timeout is not None:
+            timeout = (timeout, read_timeout)
+        self.hp = AsyncUpYunHttp(timeout, session, limit, bandwidth)
+
+        self.rest = UpYunRest(service, username, password, auth_server,
+                              endpoint or ED_AUTO, self.chunksize, None,
+                              signer)
+        self.av = AvPretreatment(service, username, password, auth_server,
+                                 self.chunksize, None, signer)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        await self.hp.close()
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args))
+
+    async def _sign(self, func, *args):
+        # remote signing is a blocking HTTP call, keep it off the loop
+        if self.auth_server:
+            return await self._run(func, *args)
+        return func(*args)
+
+    async def _request(self, method, key, value=None, headers=None):
+        uri, value, headers = await self._sign(self.rest.make_request,
+                                               method, key, value, headers)
+        return await self.hp.do_http_pipe(method, self.rest.endpoint, uri,
+                                          value, headers)
+
+    async def _request_headers(self, method, key, value=None, headers=None):
+        resp = await self._request(method, key, value, headers)
+        resp.release()
+        return self.rest.get_meta_headers(resp.headers.items())
+
+    # --- public rest API
+    async def put(self, key, value, checksum=False, headers=None,
+                  secret=None):
+        headers = dict(headers or {})
+        if isinstance(value, str):
+            value = b(value)
+        if checksum is True:
+            headers['Content-MD5'] = await self._run(
+                make_content_md5, value, self.chunksize)
+        if secret:
+            headers['Content-Secret'] = secret
+        return await self._request_headers('PUT', key, value, headers)
+
+    async def get(self, key, value=None):
+        resp = await self._request('GET', key)
+        try:
+            if value is None:
+                return await resp.text(encoding='utf-8')
+            async for chunk in resp.content.iter_chunked(self.chunksize):
+                await self.hp.throttle_download(len(chunk))
+                value.write(chunk)
+        finally:
+            resp.release()
+
+    async def delete(self, key):
+        resp = await self._request('DELETE', key)
+        resp.release()
+
+    async def mkdir(self, key):
+        resp = await self._request('POST', key, headers={'Folder': 'true'})
+        resp.release()
+
+    async def move(self, src, dest):
+        if not src:
+            raise UpYunClientException("missing source")
+        if not dest:
+            raise UpYunClientException("missing destination")
+        source = '/%s/%s' % (self.rest.service,
+                             src if src[0] != '/' else src[1:])
+        headers = {"X-Upyun-Move-Source": source}
+        return await self._request_headers('PUT', dest, None, headers)
+
+    async def copy(self, src, dest):
+        if not src:
+            raise UpYunClientException("missing source")
+        if not dest:
+            raise UpYunClientException("missing destination")
+        source = '/%s/%s' % (self.rest.service,
+                             src if src[0] != '/' else src[1:])
+        headers = {"X-Upyun-Copy-Source": source}
+        return await self._request_headers('PUT', dest, None, headers)
+
+    async def getinfo(self, key):
+        return await self._request_headers('HEAD', key)
+
+    async def getlist(self, key='/', limit=None, order=None, begin=None):
+        headers = self.rest.make_list_headers(limit, order, begin)
+        content = await self.get_text(key, headers)
+        if content == '':
+            return []
+        return [self.rest.parse_list_line(x) for x in content.split('\n')]
+
+    async def get_text(self, key, headers=None):
+        resp = await self._request('GET', key, headers=headers)
+        try:
+            return await resp.text(encoding='utf-8')
+        finally:
+            resp.release()
+
+    async def list_page(self, key, limit=None, order=None, begin=None):
+        headers = self.rest.make_list_headers(limit, order, begin)
+        resp = await self._request('GET', key, headers=headers)
+        try:
+            content = await resp.text(encoding='utf-8')
+        finally:
+            resp.release()
+        return content, resp.headers.get('x-upyun-list-iter')
+
+    async def iterlist(self, key='/', limit=None, order=None, begin=None):
+        limit = limit or LIST_LIMIT
+        content, begin = await self.list_page(key, limit, order, begin)
+        next_page = None
+        try:
+            while True:
+                if content and begin and begin != LIST_ITER_EOF:
+                    next_page = asyncio.ensure_future(
+                        self.list_page(key, limit, order, begin))
+                for line in content.split('\n'):
+                    if line:
+                        yield ListEntry.parse(line)
+                if next_page is None:
+                    break
+                content, begin = await next_page
+                next_page = None
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+
+    async def purge(self, keys, domain=None):
+        domain = domain or '%s.b0.upaiyun.com' % (self.rest.service)
+        params, headers = self.rest.make_purge_request(keys, domain)
+        resp = await self.hp.do_http_pipe('POST', PURGE_HOST, '/purge/',
+                                          params, headers)
+        try:
+            content = await resp.json(content_type=None)
+        finally:
+            resp.release()
+        return self.rest.parse_purge_response(content, domain)
+
+    # --- video pretreatment API
+    async def pretreat(self, tasks, source, notify_url=''):
+        data = self.av.make_pretreat_data(tasks, source, notify_url)
+        method, uri, headers, value = await self._sign(
+            self.av.make_pretreat_request, data)
+        resp = await self.hp.do_http_pipe(method, self.av.HOST, uri,
+                                          value, headers)
+        try:
+            return await resp.json(content_type=None)
+        finally:
+            resp.release()
@@ -7,8 +7,8 @@ from .modules.compat import urlencode, b
 from .modules.exception import UpYunClientException, UpYunServiceException
 from .modules.sign import (
     decode_msg,
-    make_signature,
-    make_content_md5
+    make_content_md5,
+    Signer
 )
 from .modules.httpipe import cur_dt
 
@@ -26,22 +26,27 @@ class AvPretreatment(object):
             'signature']
 
     def __init__(self, service, operator, password,
-                 auth_server, chunksize, hp):
+                 auth_server, chunksize, hp, signer=None):
         self.service = service
         self.operator = operator
         self.password = password
         self.auth_server = auth_server
+        self.signer = signer or Signer(operator, password, auth_server)
         self.chunksize = chunksize
         self.hp = hp
 
     # --- public API
     def pretreat(self, tasks, source, notify_url, app_name=None):
+        data = self.make_pretreat_data(tasks, source, notify_url, app_name)
+        return self.__requests_pretreatment(data)
+
+    def make_pretreat_data(self, tasks, source, notify_url, app_name=None):
         data = {'service': self.service, 'source': source,
                 'notify_url': notify_url, 'tasks': tasks,
                 'app_name': app_name, 'accept': 'json'}
         if not app_name:
             data.pop('app_name')
-        return self.__requests_pretreatment(data)
+        return data
 
     def status(self, taskids):
         data = {}
@@ -61,8 +66,7 @@ class AvPretreatment(object):
                                     'Servers except respond tasks list',
                                     'Service Error')
 
-    # --- private API
-    def __requests_pretreatment(self, data):
+    def make_pretreat_request(self, data):
         method = 'POST'
         tasks = data['tasks']
         assert isinstance(tasks, list)
@@ -72,17 +76,20 @@ class AvPretreatment(object):
         value = urlencode(data)
         dt = cur_dt()
         md5sum = make_content_md5(b(value))
-        signature = make_signature(username=self.operator,
-                                   password=self.password,
-                                   auth_server=self.auth_server,
-                                   method=method, uri=uri,
-                                   date=dt, content_md5=md5sum)
+        signature = self.signer.sign(method, uri, dt, content_md5=md5sum)
         headers = {'Authorization': signature,
                    'Content-Type': 'application/x-www-form-urlencoded',
                    'Date': dt,
                    'Content-MD5': md5sum}
+        return method, uri, headers, value
+
+    # --- private API
+    def __requests_pretreatment(self, data):
+        method, uri, headers, value = self.make_pretreat_request(data)
         resp = self.hp.do_http_pipe(method, self.HOST, uri,
-                                    headers=headers, value=value)
+                                    headers=headers, value=value,
+                                    sign=self.__make_sign(method, uri,
+                                                          headers))
         return self.__handle_resp(resp)
 
     def __requests_status(self, data):
@@ -90,15 +97,26 @@ class AvPretreatment(object):
         dt = cur_dt()
         data = urlencode(data)
         uri = '%s?%s' % (self.STATUS, data)
-        signature = make_signature(username=self.operator,
-                                   password=self.password,
-                                   auth_server=self.auth_server,
-                                   method=method, uri=uri, date=dt)
+        signature = self.signer.sign(method, uri, dt)
         headers = {'Authorization': signature,
                    'Date': dt}
-        resp = self.hp.do_http_pipe(method, self.HOST, uri, headers=headers)
+        resp = self.hp.do_http_pipe(method, self.HOST, uri, headers=headers,
+                                    sign=self.__make_sign(method, uri,
+                                                          headers))
         return self.__handle_resp(resp)
 
+    def __make_sign(self, method, uri, headers):
+        """重试时使用新的 Date 重新签名"""
+        content_md5 = headers.get('Content-MD5')
+
+        def sign(headers):
+            dt = cur_dt()
+            headers['Authorization'] = self.signer.sign(
+                method, uri, dt, content_md5=content_md5)
+            headers['Date'] = dt
+            return headers
+        return sign
+
     def __handle_resp(self, resp):
         content = None
         try:
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import os
+import re
+import threading
+
+from .resume import UpYunRecord, memory_store
+from .modules.exception import UpYunClientException, \
+    UpYunResumeTraceException
+from .modules.parallel import imap_unordered, is_parallel
+
+DEFAULT_CHUNKSIZE = 8192
+PART_SIZE = 4 * 1024 * 1024
+log = logging.getLogger(__name__)
+
+
+class DownloadTrace(object):
+    """断点下载记录, 保存已经写入本地文件的分段
+    :param etag: 远端文件的 ETag, 变化后记录失效
+    :param file_size: 远端文件大小
+    :param part_size: 分段大小, 已有记录时以记录为准
+    :param store: BaseStore 实例, 默认采用 memory_store
+    """
+
+    def __init__(self, service, key, filename, etag, file_size, part_size,
+                 store=None):
+        self.store = store if store else memory_store
+        self.etag = etag
+        self.file_size = file_size
+        self.store_key = self.store.get_key(service, key,
+                                            'download:%s' % filename)
+        self.record = UpYunRecord(self.store.get(self.store_key))
+        try:
+            self.check(self.record)
+        except UpYunResumeTraceException as e:
+            log.debug("drop download record: {0}".format(e.msg))
+            self.delete()
+        if not self.record:
+            self.record.update({"etag": etag, "file_size": file_size,
+                                "part_size": part_size, "parts": []})
+
+    def check(self, record):
+        if not record:
+            return
+
+        if not isinstance(record.part_size, int) or record.part_size <= 0:
+            raise UpYunResumeTraceException(msg="part_size error")
+
+        if not isinstance(record.parts, list):
+            raise UpYunResumeTraceException(msg="parts error")
+
+        if self.etag != record.etag:
+            raise UpYunResumeTraceException(msg="remote etag changed")
+
+        if self.file_size != record.file_size:
+            raise UpYunResumeTraceException(msg="remote size changed")
+
+    def get(self):
+        return self.record
+
+    def commit(self):
+        self.store.set(self.store_key, self.record)
+
+    def delete(self):
+        self.store.delete(self.store_key)
+        self.record = UpYunRecord()
+
+
+class OffsetWriter(object):
+    """从指定偏移处写入文件, 多个实例可以并发写同一个文件
+    :param fileobj: 已打开的文件对象
+    :param start: 起始偏移
+    :param end: 结束偏移, 写入超出该位置时抛出异常
+    :param lock: 不支持 `os.pwrite` 时用于保护 seek/write 的锁
+    """
+
+    def __init__(self, fileobj, start, end, lock):
+        self.fileobj = fileobj
+        self.offset = start
+        self.end = end
+        self.lock = lock
+
+    def write(self, data):
+        if self.offset + len(data) > self.end:
+            raise UpYunClientException('range response out of bounds')
+        if hasattr(os, 'pwrite'):
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(self.fileobj.fileno(), view, self.offset)
+                view = view[written:]
+                self.offset += written
+        else:
+            with self.lock:
+                self.fileobj.seek(self.offset, os.SEEK_SET)
+                self.fileobj.write(data)
+            self.offset += len(data)
+
+
+class JournalWriter(object):
+    """顺序写入文件, 每写满一个分段调用一次 `on_part`, 并按整个文件的
+    大小更新进度 `hdr`"""
+
+    def __init__(self, fileobj, offset, file_size, part_size, on_part,
+                 hdr=None):
+        self.fileobj = fileobj
+        self.offset = offset
+        self.file_size = file_size
+        self.part_size = part_size
+        self.on_part = on_part
+        self.hdr = hdr
+        self.part_id = offset // part_size
+
+    def write(self, data):
+        self.fileobj.write(data)
+        self.offset += len(data)
+        if self.hdr and data:
+            if self.offset != self.file_size:
+                self.hdr.update(self.offset)
+            else:
+                self.hdr.finish()
+        while self.part_id * self.part_size < self.file_size and \
+                self.offset >= min((self.part_id + 1) * self.part_size,
+                                   self.file_size):
+            self.fileobj.flush()
+            self.on_part(self.part_id)
+            self.part_id += 1
+
+
+class UpYunDownloader(object):
+    """分段并发下载, 断点下载
+    :param rest: upyun rest 实例
+    :param key: upyun 文件名
+    :param f: 已打开的可写文件对象
+    :param workers: 并发连接数, 为 'auto' 或 `ConcurrencyController` 时
+        自动调整
+    :param part_size: 每个 Range 请求的大小
+    :param checksum: 下载完成后是否校验 MD5
+    :param need_resume: 是否记录下载进度, 以便中断后继续下载
+    :param store: BaseStore 实例, 默认采用 memory_store
+    """
+
+    def __init__(self, rest, key, f, workers=None, part_size=None,
+                 checksum=False, handler=None, params=None,
+                 need_resume=False, store=None):
+        self.rest = rest
+        self.key = key
+        self.f = f
+        self.workers = workers or 1
+        self.part_size = part_size or PART_SIZE
+        self.checksum = checksum
+        self.handler = handler
+        self.params = params
+        self.need_resume = need_resume
+        self.store = store
+        self.lock = threading.Lock()
+
+    def get_info(self):
+        info = self.rest.getinfo(self.key)
+        try:
+            file_size = int(info['file-size'])
+        except (KeyError, ValueError):
+            raise UpYunClientException('unknown file size')
+        return file_size, info
+
+    @staticmethod
+    def expected_md5(info):
+        md5 = info.get('content-md5') or info.get('etag', '').strip('"')
+        if re.match(r'^[0-9a-fA-F]{32}$', md5):
+            return md5.lower()
+        return None
+
+    def load_trace(self, file_size, info):
+        trace = DownloadTrace(self.rest.service, self.key, self.f.name,
+                              info.get('etag'), file_size, self.part_size,
+                              self.store)
+        record = trace.get()
+        self.part_size = record.part_size
+        local_size = os.fstat(self.f.fileno()).st_size
+        committed = max([min((i + 1) * self.part_size, file_size)
+                         for i in record.parts] or [0])
+        if local_size < committed:
+            log.debug("local file truncated, drop download record")
+            record.parts = []
+        log.debug("{0:>20}, parts:{1:>10}".format(
+            "load record", len(record.parts)))
+        return trace
+
+    def download_part(self, part_id, file_size):
+        start = part_id * self.part_size
+        end = min(start + self.part_size, file_size)
+        writer = OffsetWriter(self.f, start, end, self.lock)
+        headers = {'Range': 'bytes=%d-%d' % (start, end - 1)}
+        self.rest.do_http_request('GET', self.key, headers=headers,
+                                  of=writer, stream=True)
+        if writer.offset != end:
+            raise UpYunClientException('range response incomplete')
+        return end - start
+
+    def download_parallel(self, file_size, trace):
+        done = set(trace.get().parts) if trace else set()
+        count = (file_size + self.part_size - 1) // self.part_size
+        self.f.flush()
+        self.f.truncate(file_size)
+
+        hdr = None
+        if self.handler and file_size > 0:
+            hdr = self.handler(file_size, self.params)
+
+        readsofar = sum(min(self.part_size, file_size - i * self.part_size)
+                        for i in done)
+        parts = (i for i in range(count) if i not in done)
+        with self.rest.concurrency(self.workers) as workers:
+            for part_id, size, exc in imap_unordered(
+                    lambda part_id: self.download_part(part_id, file_size),
+                    parts, workers):
+                if exc is not None:
+                    raise exc
+                if trace:
+                    trace.get().parts.append(part_id)
+                    trace.commit()
+                readsofar += size
+                if hdr:
+                    if readsofar != file_size:
+                        hdr.update(readsofar)
+                    else:
+                        hdr.finish()
+
+    def download_sequential(self, file_size, trace):
+        record = trace.get()
+        done = set(record.parts)
+        part_id = 0
+        while part_id in done:
+            part_id += 1
+        offset = min(part_id * self.part_size, file_size)
+        record.parts = list(range(part_id))
+        self.f.flush()
+        self.f.truncate(offset)
+        self.f.seek(offset, os.SEEK_SET)
+        if offset == file_size:
+            return
+
+        def on_part(part_id):
+            record.parts.append(part_id)
+            trace.commit()
+
+        hdr = None
+        if self.handler:
+            # 进度以整个文件为准, 从已下载的位置开始
+            hdr = self.handler(file_size, self.params)
+            hdr.update(offset)
+        writer = JournalWriter(self.f, offset, file_size, self.part_size,
+                               on_part, hdr)
+        headers = {'Range': 'bytes=%d-' % offset} if offset else None
+        log.debug("{0:>20}, offset:{1:>10}".format("download file", offset))
+        self.rest.do_http_request('GET', self.key, headers=headers,
+                                  of=writer, stream=True)
+        if writer.offset != file_size:
+            raise UpYunClientException('response incomplete')
+
+    def verify(self, info):
+        expected = self.expected_md5(info)
+        if not expected:
+            log.debug("no md5 to verify {0}".format(self.key))
+            return
+        md5 = hashlib.md5()
+        self.f.flush()
+        with open(self.f.name, 'rb') as f:
+            for chunk in iter(lambda: f.read(DEFAULT_CHUNKSIZE), b''):
+                md5.update(chunk)
+        if md5.hexdigest() != expected:
+            raise UpYunClientException('file md5 not match')
+
+    def download(self):
+        parallel = is_parallel(self.workers) or not self.need_resume
+        if parallel and 'a' in getattr(self.f, 'mode', ''):
+            # 追加模式下 os.pwrite 及 seek 后的 write 都会写到文件末尾
+            raise UpYunClientException(
+                "parallel download needs a file opened with 'r+b' or 'wb'")
+        file_size, info = self.get_info()
+        trace = self.load_trace(file_size, info) if self.need_resume \
+            else None
+
+        if parallel:
+            self.download_parallel(file_size, trace)
+        else:
+            self.download_sequential(file_size, trace)
+
+        if trace:
+            log.debug("download done")
+            trace.delete()
+        if self.checksum:
+            self.verify(info)
+        self.f.seek(file_size, os.SEEK_SET)
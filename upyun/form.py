@@ -3,18 +3,19 @@ import os
 import time
 
 from .modules.exception import UpYunClientException
-from .modules.sign import make_policy, make_signature
+from .modules.sign import make_policy, Signer
 from .modules.httpipe import cur_dt
 
 
 class FormUpload(object):
 
     def __init__(self, service, username, password,
-                 auth_server, endpoint, hp):
+                 auth_server, endpoint, hp, signer=None):
         self.service = service
         self.username = username
         self.password = password
         self.auth_server = auth_server
+        self.signer = signer or Signer(username, password, auth_server)
         self.hp = hp
         self.host = endpoint
         self.uri = '/%s/' % service
@@ -31,15 +32,7 @@ class FormUpload(object):
         }
         data.update(kwargs)
         policy = make_policy(data)
-        signature = make_signature(
-            username=self.username,
-            password=self.password,
-            auth_server=self.auth_server,
-            method='POST',
-            uri=self.uri,
-            date=dt,
-            policy=policy
-        )
+        signature = self.signer.sign('POST', self.uri, dt, policy=policy)
         postdata = {
             'policy': policy,
             'authorization': signature,
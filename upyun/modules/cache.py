@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+from collections import OrderedDict
+
+DEFAULT_MAXSIZE = 1024
+DEFAULT_TTL = 60
+
+
+class TTLCache(object):
+    """Thread safe LRU cache whose entries expire `ttl` seconds after set.
+
+    `hits` and `misses` count lookups, for tuning `maxsize` and `ttl`.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL,
+                 timer=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None, count=True):
+        """With `count=False` the lookup is not counted; the caller reports
+        the outcome with `count()` once it knows whether it was a hit."""
+        with self.lock:
+            item = self.data.get(key)
+            if item is not None and item[1] > self.timer():
+                # move to the end as most recently used
+                del self.data[key]
+                self.data[key] = item
+                if count:
+                    self.hits += 1
+                return item[0]
+            if item is not None:
+                del self.data[key]
+            if count:
+                self.misses += 1
+            return default
+
+    def count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def set(self, key, value, ttl=None):
+        expires = self.timer() + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = (value, expires)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
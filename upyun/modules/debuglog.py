@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import atexit
+import datetime
+import io
+import logging
+import os
+import threading
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+from .compat import bytes, str
+
+DEBUG_LOG = 'debug.log'
+MAX_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 3
+MAX_BODY = 1024
+QUEUE_SIZE = 10000
+BATCH_SIZE = 512
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_writers = {}
+
+
+def truncate(value, max_body):
+    """返回截断后的字符串, 由调用方在入队前调用, 避免队列持有大块数据"""
+    if isinstance(value, memoryview):
+        return '<%d bytes>' % value.nbytes
+    if not isinstance(value, (bytes, bytearray, str)):
+        value = repr(value)
+    if len(value) > max_body:
+        return '%r... (%d bytes)' % (value[:max_body], len(value))
+    return value if isinstance(value, str) else repr(value)
+
+
+def mask_headers(headers):
+    headers = dict(headers or {})
+    if 'Authorization' in headers:
+        headers['Authorization'] = '***'
+    return headers
+
+
+class DebugLog(object):
+    """后台线程批量写入的调试日志, 不阻塞请求
+    :param path: 日志文件路径
+    :param max_bytes: 单个日志文件大小上限, 超过后轮转为 `path.1` 等
+    :param backup_count: 保留的历史日志文件个数, 0 表示直接清空
+    :param max_body: 请求体和响应内容最多记录的长度
+    :param queue_size: 等待写入的最大条数, 队列满时丢弃新的日志并计入
+        `dropped`
+    """
+
+    def __init__(self, path=DEBUG_LOG, max_bytes=MAX_BYTES,
+                 backup_count=BACKUP_COUNT, max_body=MAX_BODY,
+                 queue_size=QUEUE_SIZE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.max_body = max_body
+        self.queue = queue.Queue(queue_size)
+        self.dropped = 0
+        self.closed = False
+        self.stream = None
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.close)
+
+    def write(self, title, fields):
+        """记录一段日志, `fields` 为 (名称, 值) 列表, 在后台线程格式化;
+        较大的值请先用 `truncate` 截断"""
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait((datetime.datetime.now(), title, fields))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """等待已提交的日志全部写入文件"""
+        self.queue.join()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+    def format(self, record):
+        dt, title, fields = record
+        lines = ['', '', '## %s ## %s' % (title, dt.isoformat()), '']
+        for k, v in fields:
+            lines.append('%s: %s' % (k, v))
+        return '\n'.join(lines)
+
+    def run(self):
+        while True:
+            # 阻塞等待第一条, 再取出队列中已有的全部日志一次写入
+            records = [self.queue.get()]
+            while records[-1] is not None and len(records) < BATCH_SIZE:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = records[-1] is None
+            pending = records[:-1] if stop else records
+            try:
+                self.emit('\n'.join(map(self.format, pending)))
+            except Exception:
+                log.exception("write debug log failed")
+            for _ in records:
+                self.queue.task_done()
+            if stop:
+                if self.stream is not None:
+                    self.stream.close()
+                return
+
+    def emit(self, text):
+        if not text:
+            return
+        if self.stream is None:
+            self.stream = io.open(self.path, 'a', encoding='utf-8')
+        self.stream.write(text if isinstance(text, str) else
+                          text.decode('utf-8', 'replace'))
+        self.stream.flush()
+        if os.fstat(self.stream.fileno()).st_size >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        self.stream.close()
+        self.stream = None
+        if self.backup_count <= 0:
+            io.open(self.path, 'w').close()
+            return
+        for i in range(self.backup_count - 1, 0, -1):
+            src = '%s.%d' % (self.path, i)
+            if os.path.exists(src):
+                os.rename(src, '%s.%d' % (self.path, i + 1))
+        os.rename(self.path, self.path + '.1')
+
+
+def get_debug_log(path=DEBUG_LOG):
+    """同一路径的调试日志共用一个写入线程"""
+    with _lock:
+        writer = _writers.get(path)
+        if writer is None or writer.closed:
+            writer = _writers[path] = DebugLog(path)
+        return writer
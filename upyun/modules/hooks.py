@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+
+from collections import defaultdict
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+from .exception import UpYunClientException
+
+log = logging.getLogger(__name__)
+
+
+class RequestEvent(object):
+    """单次 HTTP 请求(每次重试各一个)的统计信息
+    :param method: HTTP 方法
+    :param host: 请求的域名
+    :param uri: 请求路径
+    :param status: HTTP 状态码, 网络错误时为 None
+    :param request_id: 响应头部 X-Request-Id
+    :param bytes_sent: 请求体字节数, 长度未知时为 None
+    :param bytes_received: 响应体字节数, 流式读取且长度未知时为 None
+    :param start: 开始时间(time.time())
+    :param ttfb: 发出请求到收到响应头部的时间(秒)
+    :param elapsed: 请求总耗时(秒), 流式读取时不包含读取响应体的时间
+    :param attempt: 第几次尝试, 从 0 开始
+    :param error: 网络错误时的异常
+    """
+    __slots__ = ('method', 'host', 'uri', 'status', 'request_id',
+                 'bytes_sent', 'bytes_received', 'start', 'ttfb', 'elapsed',
+                 'attempt', 'error')
+
+    def __init__(self, method, host, uri, status=None, request_id=None,
+                 bytes_sent=None, bytes_received=None, start=None, ttfb=None,
+                 elapsed=None, attempt=0, error=None):
+        self.method = method
+        self.host = host
+        self.uri = uri
+        self.status = status
+        self.request_id = request_id
+        self.bytes_sent = bytes_sent
+        self.bytes_received = bytes_received
+        self.start = start
+        self.ttfb = ttfb
+        self.elapsed = elapsed
+        self.attempt = attempt
+        self.error = error
+
+    def as_dict(self):
+        return dict((k, getattr(self, k)) for k in self.__slots__)
+
+    def __repr__(self):
+        return 'RequestEvent(%s)' % ', '.join(
+            '%s=%r' % kv for kv in sorted(self.as_dict().items()))
+
+
+def emit(hooks, event):
+    for hook in hooks:
+        try:
+            hook(event)
+        except Exception:
+            log.exception("request hook {0!r} failed".format(hook))
+
+
+class LoggingSink(object):
+    """把每个请求以一行日志输出
+    :param logger: 使用的 logger, 默认为 `upyun.requests`
+    :param level: 成功请求的日志级别, 失败请求使用 WARNING
+    """
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger('upyun.requests')
+        self.level = level
+
+    def __call__(self, event):
+        failed = event.error is not None or event.status // 100 != 2
+        level = logging.WARNING if failed else self.level
+        if not self.logger.isEnabledFor(level):
+            return
+        self.logger.log(
+            level, '%s %s%s %s %.3fs sent=%s received=%s attempt=%d '
+            'request_id=%s%s', event.method, event.host, event.uri,
+            event.status, event.elapsed or 0, event.bytes_sent,
+            event.bytes_received, event.attempt, event.request_id,
+            ' error=%s' % event.error if event.error is not None else '')
+
+
+class MetricsSink(object):
+    """Prometheus 风格的计数器, `render()` 返回文本格式的指标"""
+
+    def __init__(self, prefix='upyun'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.latency = defaultdict(float)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.retries = 0
+        self.errors = 0
+
+    def __call__(self, event):
+        key = (event.method, str(event.status or 'error'))
+        with self.lock:
+            self.requests[key] += 1
+            self.latency[key] += event.elapsed or 0
+            self.bytes_sent += event.bytes_sent or 0
+            self.bytes_received += event.bytes_received or 0
+            if event.attempt:
+                self.retries += 1
+            if event.error is not None:
+                self.errors += 1
+
+    def render(self):
+        p = self.prefix
+        with self.lock:
+            lines = ['# TYPE %s_requests_total counter' % p]
+            for (method, status), n in sorted(self.requests.items()):
+                lines.append('%s_requests_total{method="%s",status="%s"} %d'
+                             % (p, method, status, n))
+            lines.append('# TYPE %s_request_seconds_total counter' % p)
+            for (method, status), t in sorted(self.latency.items()):
+                lines.append(
+                    '%s_request_seconds_total{method="%s",status="%s"} %f'
+                    % (p, method, status, t))
+            for name in ('bytes_sent', 'bytes_received', 'retries',
+                         'errors'):
+                lines.append('# TYPE %s_%s_total counter' % (p, name))
+                lines.append('%s_%s_total %d' % (p, name,
+                                                 getattr(self, name)))
+        return '\n'.join(lines) + '\n'
+
+
+class OpenTelemetrySink(object):
+    """为每个请求创建一个 OpenTelemetry span, 需要安装 opentelemetry-api
+    :param tracer: 使用的 tracer, 默认为 `trace.get_tracer('upyun')`
+    """
+
+    def __init__(self, tracer=None):
+        if trace is None:
+            raise UpYunClientException(
+                'OpenTelemetrySink requires opentelemetry-api')
+        self.tracer = tracer or trace.get_tracer('upyun')
+
+    def __call__(self, event):
+        start = int(event.start * 1e9)
+        attributes = {
+            'http.method': event.method,
+            'http.url': 'http://%s%s' % (event.host, event.uri),
+            'upyun.attempt': event.attempt,
+        }
+        if event.status is not None:
+            attributes['http.status_code'] = event.status
+        if event.request_id:
+            attributes['upyun.request_id'] = event.request_id
+        if event.bytes_sent is not None:
+            attributes['http.request_content_length'] = event.bytes_sent
+        if event.bytes_received is not None:
+            attributes['http.response_content_length'] = event.bytes_received
+        if event.ttfb is not None:
+            attributes['upyun.ttfb'] = event.ttfb
+        span = self.tracer.start_span('%s %s' % (event.method, event.uri),
+                                      kind=trace.SpanKind.CLIENT,
+                                      attributes=attributes,
+                                      start_time=start)
+        if event.error is not None:
+            span.record_exception(event.error)
+        if event.error is not None or event.status // 100 != 2:
+            span.set_status(trace.Status(trace.StatusCode.ERROR))
+        span.end(end_time=start + int((event.elapsed or 0) * 1e9))
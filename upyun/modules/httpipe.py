@@ -1,10 +1,22 @@
 # -*- coding: utf-8 -*-
 import requests
 import datetime
+import itertools
+import logging
+import threading
+import time
 import upyun
 import json
 
 from .exception import UpYunServiceException, UpYunClientException
+from .compat import bytes
+from .retry import NO_RETRY, tell_body, rewind_body
+from .hooks import RequestEvent, emit
+from .debuglog import get_debug_log, mask_headers, truncate
+from .ratelimit import ThrottledReader
+
+DEFAULT_POOLSIZE = 10
+log = logging.getLogger(__name__)
 
 
 # - wsgiref.handlers.format_date_time
@@ -22,65 +34,138 @@ def httpdate_rfc1123(dt):
         (weekday, dt.day, month, dt.year, dt.hour, dt.minute, dt.second)
 
 
-# - Date Format: RFC 1123
+_cur_dt = (None, None)
+
+
+# - Date Format: RFC 1123, formatted at most once per second
 def cur_dt():
-    return httpdate_rfc1123(datetime.datetime.utcnow())
+    global _cur_dt
+    now = int(time.time())
+    second, dt = _cur_dt
+    if second != now:
+        dt = httpdate_rfc1123(datetime.datetime.utcfromtimestamp(now))
+        _cur_dt = (now, dt)
+    return dt
 
 
 class UpYunHttp(object):
-    def __init__(self, timeout, debug):
+    def __init__(self, timeout, debug, pool_connections=None,
+                 pool_maxsize=None, pool_block=False, max_retries=None,
+                 retry=None, hooks=None, bandwidth=None):
         self.timeout = timeout
-        self.debug = debug
+        self.bandwidth = bandwidth
+        self.debug = get_debug_log() if debug is True else (debug or None)
+        self.retry = retry or NO_RETRY
+        self.hooks = list(hooks or ())
+        self.hook_refs = {}
+        self.hooks_lock = threading.Lock()
         self.session = requests.Session()
         self.user_agent = None
+        self.mount_adapter(pool_connections, pool_maxsize, pool_block,
+                           max_retries)
+
+    def mount_adapter(self, pool_connections=None, pool_maxsize=None,
+                      pool_block=False, max_retries=None):
+        self.pool_maxsize = pool_maxsize or DEFAULT_POOLSIZE
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_connections or DEFAULT_POOLSIZE,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=pool_block,
+            max_retries=max_retries or 0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def do_http_pipe(self, method, host, uri, value=None, headers={},
+                     stream=False, files=None, sign=None, retry=None,
+                     idempotent=None):
+        """发送请求, 按重试策略重试失败的请求
+        :param sign: 重试前调用 `sign(headers)` 更新 Date 并重新签名
+        :param retry: 本次请求使用的 `RetryPolicy`, False 表示不重试,
+            默认使用 `self.retry`
+        :param idempotent: 请求是否幂等, 默认由 HTTP 方法判断
+        """
+        retry = self.retry if retry is None else (retry or NO_RETRY)
+        positions = tell_body(value, files)
+        for attempt in itertools.count():
+            try:
+                return self.__do_http_pipe(method, host, uri, value, headers,
+                                           stream, files, attempt)
+            except UpYunServiceException as e:
+                status, error, resp_headers = e.status, None, e.headers
+                if attempt >= retry.retries or positions is False or \
+                        not retry.is_retryable(method, status=status,
+                                               idempotent=idempotent):
+                    raise
+            except UpYunClientException as e:
+                status, error, resp_headers = None, e.args[0], None
+                if attempt >= retry.retries or positions is False or \
+                        not retry.is_retryable(method, error=error,
+                                               idempotent=idempotent):
+                    raise
+            delay = retry.get_backoff(attempt, requests.structures.
+                                      CaseInsensitiveDict(resp_headers or ()))
+            log.debug("retry {0} {1} in {2:.2f}s: {3}".format(
+                method, uri, delay, status or error))
+            retry.sleep(delay)
+            rewind_body(positions)
+            if sign is not None:
+                headers = sign(dict(headers))
 
     # - http://docs.python-requests.org/
-    def do_http_pipe(self, method, host, uri,
-                     value=None, headers={}, stream=False, files=None):
+    def __do_http_pipe(self, method, host, uri, value=None, headers={},
+                       stream=False, files=None, attempt=0):
         request_id, msg, err, status = [None] * 4
+        start = time.time() if self.hooks else None
         url = 'http://%s%s' % (host, uri)
-        requests.adapters.DEFAULT_RETRIES = 5
         headers = self.__set_headers(headers)
 
         if self.debug:
-            with open('debug.log', 'a') as f:
-                f.write('\n\n## Http request params ##\n\n')
-                kwargs = {'method': method, 'host': host, 'uri': uri,
-                          'value': value, 'headers': headers,
-                          'stream': stream, 'files': files,
-                          'timeout': self.timeout,
-                          }
-                f.write('\n'.join(map(lambda kv: '%s: %s'
-                                  % (kv[0], kv[1]), kwargs.items())))
+            # 在当前线程截断请求体, 队列中不保留分块数据及 mmap 切片的引用
+            self.debug.write('Http request params', [
+                ('method', method), ('host', host), ('uri', uri),
+                ('value', truncate(value, self.debug.max_body)),
+                ('headers', mask_headers(headers)),
+                ('stream', stream), ('files', files),
+                ('timeout', self.timeout)])
+
+        if self.bandwidth is not None and \
+                self.bandwidth.upload is not None and value and \
+                isinstance(value, (bytes, bytearray, memoryview)):
+            # 内存中的请求体分块限速发送; 文件等流式请求体在读取时限速
+            value = ThrottledReader(value, self.bandwidth)
 
         try:
-            resp = self.session.request(method, url, data=value,
-                                        headers=headers, stream=stream,
-                                        timeout=self.timeout, files=files)
+            try:
+                resp = self.session.request(method, url, data=value,
+                                            headers=headers, stream=stream,
+                                            timeout=self.timeout, files=files)
+            finally:
+                # 响应及异常回溯仍引用请求体, 发送完即释放
+                if isinstance(value, ThrottledReader):
+                    value.close()
             resp.encoding = 'utf-8'
             try:
                 request_id = resp.headers['X-Request-Id']
             except KeyError:
                 request_id = 'Unknown'
             status = resp.status_code
+            if start is not None:
+                self.__emit(method, host, uri, attempt, start, resp=resp,
+                            stream=stream)
             if status // 100 != 2:
                 msg = resp.reason or "Unknown"
                 err = resp.text
                 headers = resp.headers.items()
 
             if self.debug:
-                with open('debug.log', 'a') as f:
-                    f.write('\n\n## Http responds ##\n\n')
-                    kwargs = {'request_id': request_id, 'status': status,
-                              'msg': msg, 'err': err}
-                    f.write('\n'.join(map(lambda kv: '%s: %s'
-                                      % (kv[0], kv[1]), kwargs.items())))
-
-        except requests.exceptions.ConnectionError as e:
-            raise UpYunClientException(e)
-        except requests.exceptions.RequestException as e:
-            raise UpYunClientException(e)
+                self.debug.write('Http responds', [
+                    ('request_id', request_id), ('status', status),
+                    ('msg', msg), ('err', truncate(err, self.debug.max_body))])
+
         except Exception as e:
+            if start is not None and status is None:
+                self.__emit(method, host, uri, attempt, start,
+                            headers=headers, error=e)
             raise UpYunClientException(e)
 
         if msg:
@@ -88,14 +173,70 @@ class UpYunHttp(object):
 
         return resp
 
-    def __make_user_agent(self):
-        default = 'upyun-python-sdk/%s' % upyun.__version__
-        return json.dumps('%s %s' % (
-            default, requests.utils.default_user_agent()))
-
     def __set_headers(self, headers):
-        if 'Date' not in headers:
-            headers['Date'] = cur_dt()
-        if 'User-Agent' not in headers:
-            headers['User-Agent'] = self.__make_user_agent()
-        return headers
+        return set_default_headers(headers)
+
+    def add_hook(self, hook):
+        """注册请求回调, 每次请求(包括重试)结束后以 `RequestEvent` 调用"""
+        with self.hooks_lock:
+            # 复制后替换, 不影响其他线程正在遍历的回调列表
+            self.hooks = self.hooks + [hook]
+
+    def acquire_hook(self, hook):
+        """在任务期间临时注册回调, 按引用计数, 共享同一回调的任务全部结束
+        后才移除; 已通过 `add_hook` 注册的回调不受影响, 返回 False"""
+        with self.hooks_lock:
+            count = self.hook_refs.get(id(hook), 0)
+            if not count and hook in self.hooks:
+                return False
+            self.hook_refs[id(hook)] = count + 1
+            if not count:
+                self.hooks = self.hooks + [hook]
+            return True
+
+    def release_hook(self, hook):
+        """释放 `acquire_hook` 的一次注册"""
+        with self.hooks_lock:
+            count = self.hook_refs.pop(id(hook)) - 1
+            if count:
+                self.hook_refs[id(hook)] = count
+            else:
+                self.hooks = [h for h in self.hooks if h is not hook]
+
+    def __emit(self, method, host, uri, attempt, start, resp=None,
+               stream=False, headers=None, error=None):
+        event = RequestEvent(method, host, uri, start=start, attempt=attempt,
+                             elapsed=time.time() - start, error=error)
+        if resp is not None:
+            headers = resp.request.headers
+            event.status = resp.status_code
+            event.request_id = resp.headers.get('X-Request-Id')
+            event.ttfb = resp.elapsed.total_seconds()
+            length = resp.headers.get('Content-Length')
+            if method == 'HEAD':
+                event.bytes_received = 0
+            elif length is not None:
+                event.bytes_received = int(length)
+            elif not stream:
+                event.bytes_received = len(resp.content)
+        length = (headers or {}).get('Content-Length')
+        if length is not None:
+            event.bytes_sent = int(length)
+        elif resp is not None and (resp.request.body is None or
+                                   isinstance(resp.request.body, bytes)):
+            event.bytes_sent = len(resp.request.body or b'')
+        emit(self.hooks, event)
+
+
+def make_user_agent():
+    default = 'upyun-python-sdk/%s' % upyun.__version__
+    return json.dumps('%s %s' % (
+        default, requests.utils.default_user_agent()))
+
+
+def set_default_headers(headers):
+    if 'Date' not in headers:
+        headers['Date'] = cur_dt()
+    if 'User-Agent' not in headers:
+        headers['User-Agent'] = make_user_agent()
+    return headers
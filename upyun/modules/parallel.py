@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+import itertools
+import threading
+import time
+
+import requests
+from concurrent import futures
+
+from .exception import UpYunServiceException, UpYunClientException
+
+DEFAULT_WORKERS = 5
+AUTO_WORKERS = 'auto'
+
+
+def is_congestion(status=None, error=None):
+    """429, 5xx and network timeouts mean the server or the link is
+    overloaded."""
+    if status is not None:
+        return status == 429 or status // 100 == 5
+    return isinstance(error, (requests.exceptions.Timeout,
+                              requests.exceptions.ConnectionError))
+
+
+class ConcurrencyController(object):
+    """AIMD (additive increase, multiplicative decrease) concurrency limit.
+
+    Completions are counted in windows of `workers` tasks. After each
+    window the limit grows by one while the completion rate keeps improving
+    by more than `threshold`, and is held otherwise. A congestion signal
+    (429, 5xx, timeout) multiplies the limit by `decrease`; further
+    signals during the next `cooldown` seconds are ignored, so a burst of
+    failures from the same overload only backs off once.
+
+    Pass an instance (or `'auto'`) as `workers` to the parallel transfer
+    APIs. An instance is also a request hook: registered on the client it
+    sees failures that are later retried by the retry policy.
+    """
+
+    def __init__(self, initial=2, min_workers=1, max_workers=32,
+                 decrease=0.5, threshold=0.05, cooldown=1.0,
+                 timer=time.time):
+        self.limit = float(min(initial, max_workers))
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.decrease = decrease
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.timer = timer
+        self.lock = threading.Lock()
+        self.last_rate = None
+        self.hold_until = 0
+        self.reset_window()
+
+    @property
+    def workers(self):
+        return int(self.limit)
+
+    def reset_window(self):
+        self.window_start = self.timer()
+        self.window_done = 0
+
+    def on_success(self):
+        with self.lock:
+            self.window_done += 1
+            if self.window_done < self.workers:
+                return
+            elapsed = self.timer() - self.window_start
+            rate = self.window_done / elapsed if elapsed > 0 else None
+            if rate is not None and (
+                    self.last_rate is None or
+                    rate > self.last_rate * (1 + self.threshold)):
+                self.limit = min(self.limit + 1, self.max_workers)
+            self.last_rate = rate
+            self.reset_window()
+
+    def on_congestion(self):
+        with self.lock:
+            now = self.timer()
+            if now < self.hold_until:
+                return
+            self.limit = max(self.limit * self.decrease, self.min_workers)
+            self.hold_until = now + self.cooldown
+            self.last_rate = None
+            self.reset_window()
+
+    def on_result(self, exc=None):
+        if exc is None:
+            self.on_success()
+        elif isinstance(exc, UpYunServiceException):
+            if is_congestion(status=exc.status):
+                self.on_congestion()
+        elif isinstance(exc, UpYunClientException) and exc.args:
+            if is_congestion(error=exc.args[0]):
+                self.on_congestion()
+
+    def __call__(self, event):
+        if is_congestion(event.status, event.error):
+            self.on_congestion()
+
+
+def get_controller(workers, max_workers=None):
+    """Return the `ConcurrencyController` for `workers`, or None when
+    `workers` is a fixed number. For `'auto'` a new controller is built,
+    capped at `max_workers` (e.g. the HTTP connection pool size)."""
+    if workers == AUTO_WORKERS:
+        if max_workers:
+            return ConcurrencyController(max_workers=max_workers)
+        return ConcurrencyController()
+    if isinstance(workers, ConcurrencyController):
+        return workers
+    return None
+
+
+def is_parallel(workers):
+    return get_controller(workers) is not None or (workers or 1) > 1
+
+
+def imap_unordered(func, iterable, workers=DEFAULT_WORKERS, max_pending=None):
+    """Run `func` over `iterable` with a bounded thread pool.
+
+    Items are pulled from `iterable` lazily in the calling thread, so at most
+    `max_pending` (default twice `workers`) tasks are in flight at any time.
+    `workers` may also be `'auto'` or a `ConcurrencyController`, in which
+    case the number of tasks in flight follows the controller.
+    Yields `(item, result, exception)` tuples in completion order.
+    """
+    controller = get_controller(workers)
+    if controller is not None:
+        workers = controller.max_workers
+    max_pending = max_pending or 2 * workers
+    items = iter(iterable)
+    pending = {}
+    executor = futures.ThreadPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            limit = controller.workers if controller else max_pending
+            for item in itertools.islice(items,
+                                         max(limit - len(pending), 0)):
+                pending[executor.submit(func, item)] = item
+            if not pending:
+                break
+            done, _ = futures.wait(pending,
+                                   return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                try:
+                    result, exc = future.result(), None
+                except Exception as e:
+                    result, exc = None, e
+                if controller is not None:
+                    controller.on_result(exc)
+                yield item, result, exc
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+        # exceptions raised by `future.result()` keep this frame alive through
+        # their traceback; drop the unsent items so they are freed right away
+        pending.clear()
+
+
+def crawl(func, roots, workers=DEFAULT_WORKERS, max_pending=None):
+    """Like `imap_unordered`, but the work list grows while running.
+
+    `func(item)` returns `(result, children)`; `children` are scheduled as
+    new items. Queued items are kept on a stack (depth first) and at most
+    `max_pending` (default twice `workers`) tasks are in flight, so results
+    are produced only as fast as the caller consumes them. `workers` may be
+    a `ConcurrencyController` as in `imap_unordered`.
+    Yields `(item, result, exception)` tuples in completion order.
+    """
+    controller = get_controller(workers)
+    if controller is not None:
+        workers = controller.max_workers
+    max_pending = max_pending or 2 * workers
+    stack = list(roots)
+    pending = {}
+    executor = futures.ThreadPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            limit = controller.workers if controller else max_pending
+            while stack and len(pending) < limit:
+                item = stack.pop()
+                pending[executor.submit(func, item)] = item
+            if not pending:
+                break
+            done, _ = futures.wait(pending,
+                                   return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                try:
+                    (result, children), exc = future.result(), None
+                except Exception as e:
+                    result, exc = None, e
+                else:
+                    stack.extend(children)
+                if controller is not None:
+                    controller.on_result(exc)
+                yield item, result, exc
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+        # exceptions raised by `future.result()` keep this frame alive through
+        # their traceback; drop the unsent items so they are freed right away
+        pending.clear()
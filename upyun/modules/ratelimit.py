@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+CHUNKSIZE = 8192
+
+
+class TokenBucket(object):
+    """线程安全的令牌桶, 每秒补充 `rate` 个令牌, 最多积累 `capacity` 个
+
+    `acquire` 先扣除令牌再在锁外等待欠下的部分, 并发调用按顺序排队;
+    一次申请超过 `capacity` 也可以, 只是等待更久
+    """
+
+    def __init__(self, rate, capacity=None, timer=time.time,
+                 sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(rate, 1))
+        self.tokens = self.capacity
+        self.timer = timer
+        self.sleep = sleep
+        self.last = timer()
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """预留 tokens, 返回需要等待的秒数, 由调用者自行等待"""
+        with self.lock:
+            now = self.timer()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= tokens
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def acquire(self, tokens=1):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+
+class BandwidthLimiter(object):
+    """上传和下载分别限速, 可以在多个客户端及线程, 协程之间共享
+    :param upload: 上传速度上限(字节/秒), None 表示不限制
+    :param download: 下载速度上限(字节/秒), None 表示不限制
+    :param burst: 允许突发的字节数, 默认为一秒的额度
+    """
+
+    def __init__(self, upload=None, download=None, burst=None):
+        self.upload = TokenBucket(upload, burst) if upload else None
+        self.download = TokenBucket(download, burst) if download else None
+
+    def throttle_upload(self, nbytes):
+        if self.upload is not None and nbytes:
+            self.upload.acquire(nbytes)
+
+    def throttle_download(self, nbytes):
+        if self.download is not None and nbytes:
+            self.download.acquire(nbytes)
+
+
+class ThrottledReader(object):
+    """按上传限速分块发送内存中的请求体(bytes, bytearray, memoryview),
+    每读取一块申请一次令牌, 避免整块申请后以线路速度突发发送;
+    `len()` 返回总长度, 仍以 Content-Length 方式上传。`bandwidth` 为 None
+    时只分块读取, 由调用方限速(如异步客户端)
+    """
+
+    def __init__(self, data, bandwidth, chunksize=CHUNKSIZE):
+        self.view = memoryview(data)
+        self.bandwidth = bandwidth
+        self.chunksize = chunksize
+        self.offset = 0
+
+    def __len__(self):
+        return self.view.nbytes
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunksize)
+            if not chunk:
+                break
+            yield chunk
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.chunksize
+        chunk = self.view[self.offset:self.offset + size].tobytes()
+        self.offset += len(chunk)
+        if self.bandwidth is not None:
+            self.bandwidth.throttle_upload(len(chunk))
+        return chunk
+
+    def close(self):
+        """释放对请求体的引用(如 mmap 切片)"""
+        self.view.release()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import random
+import time
+
+import requests
+
+from .compat import bytes, str
+
+DEFAULT_RETRIES = 3
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+# 以下状态表示请求未被处理, 非幂等请求也可以重试
+SAFE_STATUSES = frozenset([429])
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'])
+
+
+class RetryPolicy(object):
+    """请求失败后的重试策略
+    :param retries: 最大重试次数, 0 表示不重试
+    :param backoff: 第一次重试前的等待时间(秒), 之后每次翻倍
+    :param max_backoff: 单次等待时间上限(秒)
+    :param jitter: 是否在 [0, 等待时间] 内随机等待, 避免大量请求同时重试
+    :param statuses: 幂等请求可以重试的 HTTP 状态码
+    :param safe_statuses: 任何请求都可以重试的 HTTP 状态码
+    :param methods: 视为幂等的 HTTP 方法
+
+    连接超时(请求尚未发出)的请求总是可以重试, 其他网络错误只重试幂等
+    请求; 响应带有 `Retry-After` 头部时优先按其等待。请求体无法回到
+    起始位置(如 chunked 上传的生成器)时不重试
+    """
+
+    def __init__(self, retries=DEFAULT_RETRIES, backoff=0.5, max_backoff=10,
+                 jitter=True, statuses=RETRY_STATUSES,
+                 safe_statuses=SAFE_STATUSES, methods=IDEMPOTENT_METHODS,
+                 sleep=time.sleep):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = frozenset(statuses)
+        self.safe_statuses = frozenset(safe_statuses)
+        self.methods = frozenset(m.upper() for m in methods)
+        self.sleep = sleep
+
+    def replace(self, **kwargs):
+        params = dict(retries=self.retries, backoff=self.backoff,
+                      max_backoff=self.max_backoff, jitter=self.jitter,
+                      statuses=self.statuses,
+                      safe_statuses=self.safe_statuses,
+                      methods=self.methods, sleep=self.sleep)
+        params.update(kwargs)
+        return RetryPolicy(**params)
+
+    def is_retryable(self, method, status=None, error=None,
+                     idempotent=None):
+        if idempotent is None:
+            idempotent = method.upper() in self.methods
+        if status is not None:
+            return status in self.safe_statuses or \
+                (idempotent and status in self.statuses)
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        return idempotent and isinstance(
+            error, (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError))
+
+    def get_backoff(self, attempt, headers=None):
+        retry_after = (headers or {}).get('Retry-After')
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                pass
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+
+NO_RETRY = RetryPolicy(retries=0)
+
+
+def tell_body(value, files=None):
+    """记录请求体的起始位置, 用于重试前回退; 无法回退时返回 False"""
+    if files:
+        fileobjs = list(iter_files(files))
+        if not all(seekable(f) for f in fileobjs):
+            return False
+        return [(f, f.tell()) for f in fileobjs]
+    if value is None or isinstance(value, (bytes, str, memoryview,
+                                           bytearray, dict)):
+        return None
+    if seekable(value):
+        return [(value, value.tell())]
+    return False
+
+
+def rewind_body(positions):
+    for f, pos in positions or ():
+        f.seek(pos)
+
+
+def iter_files(files):
+    items = files.values() if isinstance(files, dict) else files
+    for item in items:
+        f = item[1] if isinstance(item, tuple) else item
+        if hasattr(f, 'read'):
+            yield f
+
+
+def seekable(f):
+    try:
+        return f.seekable()
+    except AttributeError:
+        return hasattr(f, 'seek') and hasattr(f, 'tell')
+    except Exception:
+        return False
@@ -4,24 +4,34 @@ import hashlib
 import base64
 import hmac
 import json
+import threading
+import time
 
 import requests
 
+from .cache import TTLCache
 from .compat import b, PY3, builtin_str, bytes, str
 from .exception import UpYunClientException
 
 DEFAULT_CHUNKSIZE = 8192
+SIGNATURE_TTL = 60
+SIGN_TIMEOUT = 60
+BATCH_SIZE = 100
+BATCH_WAIT = 0.002
+SIGN_FIELDS = ('username', 'method', 'uri', 'date', 'policy', 'content_md5')
 
 
 def make_content_md5(value, chunksize=DEFAULT_CHUNKSIZE):
     if hasattr(value, 'fileno'):
+        # 从当前位置计算, 完成后回到该位置, 与上传的范围一致
+        pos = value.tell()
         md5 = hashlib.md5()
         for chunk in iter(lambda: value.read(chunksize), b''):
             md5.update(chunk)
-        value.seek(0)
+        value.seek(pos)
         return md5.hexdigest()
-    elif isinstance(value, bytes) or (not PY3 and
-                                      isinstance(value, builtin_str)):
+    elif isinstance(value, (bytes, memoryview)) or \
+            (not PY3 and isinstance(value, builtin_str)):
         return hashlib.md5(value).hexdigest()
     else:
         raise UpYunClientException('object type error')
@@ -61,8 +71,7 @@ def make_signature(**kwargs):
 
     if kwargs.get('auth_server'):
         auth_server = kwargs.pop('auth_server')
-        resp = requests.post(auth_server, json=kwargs)
-        return resp.text
+        return get_auth_signer(auth_server).sign(**kwargs)
 
     signarr = [kwargs['method'], kwargs['uri'], kwargs['date']]
     if kwargs.get('policy'):
@@ -77,7 +86,146 @@ def make_signature(**kwargs):
     return 'UPYUN %s:%s' % (kwargs['username'], signature)
 
 
+class Signer(object):
+    """Precomputed signer, create once per client and share between requests.
+
+    The HMAC state keyed with the password is built once and copied for
+    every request. With `auth_server` the signature is requested from the
+    remote authentication server instead.
+    """
+
+    def __init__(self, username, password, auth_server=None):
+        self.username = username
+        self.password = password
+        self.auth_server = auth_server
+        self.prefix = 'UPYUN %s:' % username
+        self.hmac = None
+        if password and not auth_server:
+            self.hmac = hmac.new(b(password), digestmod=hashlib.sha1)
+
+    def sign(self, method, uri, date, policy=None, content_md5=None):
+        if self.auth_server:
+            kwargs = {'username': self.username, 'password': self.password,
+                      'method': method, 'uri': uri, 'date': date}
+            if policy:
+                kwargs['policy'] = decode_msg(policy)
+            if content_md5:
+                kwargs['content_md5'] = content_md5
+            return get_auth_signer(self.auth_server).sign(**kwargs)
+
+        if self.hmac is None:
+            raise UpYunClientException('password is required')
+        signarr = [method, uri, date]
+        if policy:
+            signarr.append(decode_msg(policy))
+        if content_md5:
+            signarr.append(content_md5)
+        h = self.hmac.copy()
+        h.update(b('&'.join(signarr)))
+        return self.prefix + base64.b64encode(h.digest()).decode()
+
+
 def make_purge_signature(service, username, password, uri, date):
     signstr = '&'.join([uri, service, date, password])
     signature = hashlib.md5(b(signstr)).hexdigest()
     return 'UpYun %s:%s:%s' % (service, username, signature)
+
+
+class AuthServerSigner(object):
+    """Sign requests with a remote authentication server.
+
+    Requests go through a pooled session, and signatures are cached for
+    `ttl` seconds keyed by (username, method, uri, date, policy,
+    content_md5). With `batch_url`, signatures requested concurrently by
+    several threads are collected for `batch_wait` seconds and fetched
+    in one round trip: the batch endpoint receives a JSON list of sign
+    params and returns a JSON list of signatures in the same order.
+    """
+
+    def __init__(self, url, batch_url=None, session=None,
+                 timeout=SIGN_TIMEOUT, ttl=SIGNATURE_TTL,
+                 batch_size=BATCH_SIZE, batch_wait=BATCH_WAIT):
+        self.url = url
+        self.batch_url = batch_url
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.cache = TTLCache(ttl=ttl)
+        self.lock = threading.Lock()
+        self.pending = []
+        self.leading = False
+
+    def sign(self, **kwargs):
+        key = tuple(kwargs.get(k) for k in SIGN_FIELDS)
+        signature = self.cache.get(key)
+        if signature is None:
+            if self.batch_url:
+                signature = self.sign_batched(kwargs)
+            else:
+                signature = self.post(self.url, kwargs).text
+            self.cache.set(key, signature)
+        return signature
+
+    def sign_batched(self, kwargs):
+        task = {'kwargs': kwargs, 'event': threading.Event()}
+        with self.lock:
+            self.pending.append(task)
+            leader = not self.leading
+            self.leading = True
+
+        if leader:
+            time.sleep(self.batch_wait)
+            with self.lock:
+                tasks, self.pending = self.pending, []
+                self.leading = False
+            for i in range(0, len(tasks), self.batch_size):
+                self.send_batch(tasks[i:i + self.batch_size])
+        else:
+            task['event'].wait()
+
+        if 'error' in task:
+            raise task['error']
+        return task['signature']
+
+    def send_batch(self, tasks):
+        try:
+            resp = self.post(self.batch_url, [t['kwargs'] for t in tasks])
+            signatures = resp.json()
+            if len(signatures) != len(tasks):
+                raise UpYunClientException('auth server batch size error')
+            for task, signature in zip(tasks, signatures):
+                task['signature'] = signature
+        except Exception as e:
+            if not isinstance(e, UpYunClientException):
+                e = UpYunClientException(e)
+            for task in tasks:
+                task['error'] = e
+        finally:
+            for task in tasks:
+                task['event'].set()
+
+    def post(self, url, data):
+        try:
+            resp = self.session.post(url, json=data, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            raise UpYunClientException(e)
+        if resp.status_code != 200:
+            raise UpYunClientException(
+                'auth server error: %d' % resp.status_code)
+        return resp
+
+
+_signers = {}
+_signers_lock = threading.Lock()
+
+
+def get_auth_signer(auth_server):
+    """Return `auth_server` if it is a signer object, otherwise a shared
+    AuthServerSigner for the auth server url."""
+    if hasattr(auth_server, 'sign'):
+        return auth_server
+    with _signers_lock:
+        if auth_server not in _signers:
+            _signers[auth_server] = AuthServerSigner(auth_server)
+        return _signers[auth_server]
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+from .exception import UpYunClientException
+from .parallel import get_controller
+
+MB = 1024 * 1024
+MIN_PART_SIZE = MB
+MAX_PART_SIZE = 50 * MB
+# 服务端单个文件最多的分块数
+MAX_PARTS = 10000
+# 按文件大小选择时, 大文件的分块数不超过 TARGET_PARTS
+TARGET_PARTS = 1000
+# 按测得的吞吐量选择时, 单个分块的目标上传时间(秒)
+TARGET_PART_SECONDS = 2.0
+# 自动选择时的最少分块数, 并发上传时不少于并发数, 失败后只需重传一小块
+MIN_PARTS = 4
+
+
+class ThroughputMeter(object):
+    """单个连接上传速度的指数加权移动平均(字节/秒), 线程安全
+    :param alpha: 新样本的权重
+    :param min_bytes: 小于该大小的请求耗时主要是往返延迟, 不计入
+    """
+
+    def __init__(self, alpha=0.3, min_bytes=256 * 1024):
+        self.alpha = alpha
+        self.min_bytes = min_bytes
+        self.rate = None
+        self.lock = threading.Lock()
+
+    def update(self, nbytes, seconds):
+        if nbytes < self.min_bytes or seconds <= 0:
+            return
+        sample = nbytes / float(seconds)
+        with self.lock:
+            if self.rate is None:
+                self.rate = sample
+            else:
+                self.rate += self.alpha * (sample - self.rate)
+
+    def measure(self, nbytes, func, *args, **kwargs):
+        start = time.time()
+        result = func(*args, **kwargs)
+        self.update(nbytes, time.time() - start)
+        return result
+
+
+def round_up(size, unit=MB):
+    return (size + unit - 1) // unit * unit
+
+
+def min_parts(workers=None, max_workers=None):
+    controller = get_controller(workers, max_workers)
+    if controller is not None:
+        workers = controller.max_workers
+    return max(workers or 1, MIN_PARTS)
+
+
+def check_part_size(part_size, file_size=None):
+    if part_size % MB != 0 or not MIN_PART_SIZE <= part_size <= MAX_PART_SIZE:
+        raise UpYunClientException('part size wrong')
+    if file_size and (file_size + part_size - 1) // part_size > MAX_PARTS:
+        raise UpYunClientException(
+            'part size too small, more than %d parts' % MAX_PARTS)
+
+
+def choose_part_size(file_size, throughput=None, part_size=None,
+                     workers=None, max_workers=None):
+    """选择分块大小: 1M 的整数倍, 在 [1M, 50M] 之间, 且分块数不超过
+    `MAX_PARTS`; 大文件分块数尽量不超过 `TARGET_PARTS`, 测得的吞吐量越高
+    分块越大, 单个分块的上传时间约为 `TARGET_PART_SECONDS` 秒, 但分块数
+    不少于 `MIN_PARTS` 及并发数(文件足够大时)
+    :param file_size: 文件大小
+    :param throughput: 单个连接的上传速度(字节/秒), 或 `ThroughputMeter`
+    :param part_size: 指定的分块大小, 只做校验
+    :param workers: 并发数, 'auto' 或 `ConcurrencyController` 时按其
+        `max_workers` 计算
+    :param max_workers: 'auto' 时的并发数上限, 与实际上传时一致,
+        一般为客户端的 `pool_maxsize`
+    """
+    if part_size:
+        check_part_size(part_size, file_size)
+        return part_size
+    if isinstance(throughput, ThroughputMeter):
+        throughput = throughput.rate
+
+    least = round_up(file_size, MAX_PARTS) // MAX_PARTS
+    if least > MAX_PART_SIZE:
+        raise UpYunClientException(
+            'file too large, more than %d parts' % MAX_PARTS)
+    size = file_size // TARGET_PARTS
+    if throughput:
+        size = max(size, int(throughput * TARGET_PART_SECONDS))
+    parts = min_parts(workers, max_workers)
+    # 向下取整到 1M, 保证分块数不少于 parts
+    most = (file_size + parts - 1) // parts // MB * MB
+    size = max(min(size, most, MAX_PART_SIZE), least, MIN_PART_SIZE)
+    return round_up(size)
@@ -1,21 +1,83 @@
 # -*- coding: utf-8 -*-
+from .modules.compat import PY3
 from .modules.exception import UpYunClientException
+from .modules.parallel import imap_unordered, DEFAULT_WORKERS
+from .modules.tuning import check_part_size, choose_part_size
+from .modules.sign import make_content_md5
+import hashlib
+import itertools
 import json
+import logging
+import mmap
+import os
+
+PART_SIZE = 1024 * 1024
+log = logging.getLogger(__name__)
+
+
+def read_exactly(fileobj, size):
+    chunks = []
+    while size > 0:
+        chunk = fileobj.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def map_file(fileobj):
+    """只读映射整个文件, 分块以 memoryview 切片的形式读取和发送, 避免复制;
+    不支持映射(非普通文件, 空文件, Python 2 的 mmap 不支持 memoryview 等)
+    时返回 None, 由调用方按原来的方式读取文件"""
+    if not PY3:
+        return None
+    try:
+        mapped = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, ValueError, EnvironmentError):
+        return None
+    try:
+        memoryview(mapped).release()
+    except TypeError:
+        mapped.close()
+        return None
+    return mapped
+
+
+def release_part(data):
+    """释放分块切片对映射的引用, 其他类型的分块无需处理"""
+    if isinstance(data, memoryview):
+        data.release()
+
+
+def close_map(mapped):
+    """关闭映射; 调用前应已释放全部切片, 仍有引用时记录警告,
+    映射随最后一个引用被回收时关闭"""
+    try:
+        mapped.close()
+    except BufferError as e:
+        log.warning("mmap still referenced, not closed: {0}".format(e))
 
 
 class UpYunMultiUploader(object):
     """断点续传
     :param rest: upyun rest 实例
     :param key: upyun 文件名
-    :param part_size: 分块上传大小
+    :param part_size: 分块上传大小, 默认按文件大小及测得的上传速度选择
     :param part_file: 文件大小
     :param headers: 传给 `initiate_upload` 的 HTTP 头部
+    :param workers: 计划的并发数, 自动选择分块大小时分块数不少于该值
     """
 
     def __init__(self, rest, key, headers=None,
-                 part_size=None, file_size=None, upload_id=None):
-        if part_size and part_size % (1024*1024) != 0:
-            raise UpYunClientException('part size wrong')
+                 part_size=None, file_size=None, upload_id=None,
+                 workers=None):
+        if part_size:
+            check_part_size(part_size, file_size)
+        elif file_size and not upload_id:
+            part_size = choose_part_size(file_size, rest.throughput,
+                                         workers=workers,
+                                         max_workers=rest.hp.pool_maxsize)
 
         self.key = key
         self.rest = rest
@@ -37,19 +99,96 @@ class UpYunMultiUploader(object):
             headers["X-Upyun-Multi-Length"] = str(self.file_size)
         headers["X-Upyun-Multi-Stage"] = "initiate"
         headers["X-Upyun-Multi-Disorder"] = "true"
+        # 每次 initiate 都会创建新的上传, 不按幂等请求重试
         h = self.rest.do_http_request(
-            key=self.key, method="PUT", headers=headers)
+            key=self.key, method="PUT", headers=headers, idempotent=False)
         res_headers = self.rest.get_meta_headers(h)
         self.upload_id = res_headers['multi-uuid']
 
-    def upload(self, part_id, data):
+    def upload(self, part_id, data, content_md5=None, retry=None):
         headers = {
             "X-Upyun-Multi-Stage": "upload",
             "X-Upyun-Multi-Uuid": self.upload_id,
             "X-Upyun-Part-Id": str(part_id),
         }
+        if content_md5:
+            headers["Content-MD5"] = content_md5
         self.rest.do_http_request(
-            key=self.key, value=data, method="PUT", headers=headers)
+            key=self.key, value=data, method="PUT", headers=headers,
+            retry=retry)
+
+    def upload_part(self, part_id, data, retries=None, checksum=True):
+        """上传单个分块
+        :param retries: 重试次数, None 表示沿用客户端的重试策略; 客户端
+            关闭了重试时不会因此重新开启
+        """
+        content_md5 = make_content_md5(data) if checksum else None
+        retry = None
+        if retries is not None and self.rest.hp.retry.retries:
+            retry = self.rest.hp.retry.replace(retries=retries)
+        return self.rest.throughput.measure(len(data), self.upload, part_id,
+                                            data, content_md5, retry)
+
+    def upload_from(self, fileobj, workers=DEFAULT_WORKERS,
+                    retries=None, checksum=True):
+        """顺序读取 fileobj 并发上传全部分块, 完成后调用 `complete`
+        :param fileobj: 可读对象, 按 `part_size` 切块
+        :param workers: 并发线程数, 最多同时缓存 2 * workers 个分块;
+            为 'auto' 或 `ConcurrencyController` 时自动调整
+        :param retries: 单个分块失败后的重试次数, 默认沿用客户端的重试策略
+        :param checksum: 是否校验分块及整个文件的 MD5
+        """
+        part_size = self.part_size or PART_SIZE
+        md5 = hashlib.md5()
+        mapped = map_file(fileobj)
+
+        def iter_parts():
+            if mapped is not None:
+                view = memoryview(mapped)[fileobj.tell():]
+                try:
+                    for part_id, start in enumerate(range(0, len(view),
+                                                          part_size)):
+                        data = view[start:start + part_size]
+                        md5.update(data)
+                        yield part_id, data
+                finally:
+                    view.release()
+                fileobj.seek(0, os.SEEK_END)
+                return
+
+            for part_id in itertools.count():
+                data = read_exactly(fileobj, part_size)
+                if not data:
+                    break
+                md5.update(data)
+                yield part_id, data
+
+        def upload_part(part):
+            try:
+                self.upload_part(part[0], part[1], retries, checksum)
+            finally:
+                release_part(part[1])
+
+        parts = iter_parts()
+        try:
+            with self.rest.concurrency(workers) as workers:
+                results = imap_unordered(upload_part, parts, workers)
+                try:
+                    for _, _, exc in results:
+                        if exc is not None:
+                            try:
+                                self.cancel()
+                            except Exception:
+                                pass
+                            raise exc
+                finally:
+                    # 等待在途分块结束, 丢弃尚未发送的分块
+                    results.close()
+        finally:
+            parts.close()
+            if mapped is not None:
+                close_map(mapped)
+        return self.complete(md5.hexdigest() if checksum else None)
 
     def complete(self, multi_md5=None):
         headers = {
@@ -60,7 +199,7 @@ class UpYunMultiUploader(object):
             headers["X-Upyun-Multi-Md5"] = multi_md5
 
         h = self.rest.do_http_request(
-            key=self.key, method="PUT", headers=headers)
+            key=self.key, method="PUT", headers=headers, idempotent=False)
         res_headers = self.rest.get_meta_headers(h)
         return res_headers
 
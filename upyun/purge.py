@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent import futures
+
+from .modules.compat import builtin_str
+from .modules.exception import UpYunClientException
+from .modules.parallel import DEFAULT_WORKERS
+from .modules.ratelimit import TokenBucket
+
+PURGE_BATCH_SIZE = 500
+PURGE_WINDOW = 0.5
+log = logging.getLogger(__name__)
+
+
+class PurgeQueue(object):
+    """缓存刷新队列, 去重后分批并发提交
+    :param rest: upyun rest 实例
+    :param domain: 刷新的域名, 默认为服务的默认域名
+    :param batch_size: 每个刷新请求最多包含的 URL 数
+    :param workers: 并发请求数
+    :param rate: 每秒最多提交的刷新请求数, 默认不限制
+    :param window: 合并窗口(秒), 窗口内提交的 URL 合并为同一批请求
+
+    凑满 `batch_size` 的批次立即提交; 提交失败的 URL 及异常记录在
+    `failed` 中, 无效的 URL 记录在 `invalid` 中
+    """
+
+    def __init__(self, rest, domain=None, batch_size=PURGE_BATCH_SIZE,
+                 workers=DEFAULT_WORKERS, rate=None, window=PURGE_WINDOW):
+        self.rest = rest
+        self.domain = domain
+        self.batch_size = batch_size
+        self.window = window
+        self.limiter = TokenBucket(rate) if rate else None
+        self.pending = OrderedDict()
+        self.deadline = None
+        self.closed = False
+        self.invalid = []
+        self.failed = {}
+        self.cond = threading.Condition()
+        self.executor = futures.ThreadPoolExecutor(max_workers=workers)
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, keys):
+        if isinstance(keys, builtin_str):
+            keys = [keys]
+        with self.cond:
+            if self.closed:
+                raise UpYunClientException('purge queue closed')
+            for key in keys:
+                self.pending[key] = None
+            if self.deadline is None:
+                self.deadline = time.time() + self.window
+            self.cond.notify()
+
+    def flush(self):
+        """立即提交所有等待中的 URL, 不等待请求完成"""
+        with self.cond:
+            self.deadline = time.time()
+            self.cond.notify()
+
+    def close(self):
+        """提交所有等待中的 URL 并等待全部请求完成"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.thread.join()
+        self.executor.shutdown(wait=True)
+        return self.invalid
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def take(self):
+        with self.cond:
+            while True:
+                expired = self.closed or (self.deadline is not None and
+                                          time.time() >= self.deadline)
+                if len(self.pending) >= self.batch_size or \
+                        (self.pending and expired):
+                    break
+                if self.closed:
+                    return None
+                timeout = None
+                if self.deadline is not None:
+                    timeout = max(self.deadline - time.time(), 0)
+                self.cond.wait(timeout)
+
+            keys = list(self.pending)
+            if not expired:
+                keys = keys[:len(keys) - len(keys) % self.batch_size]
+            for key in keys:
+                del self.pending[key]
+            if not self.pending:
+                self.deadline = None
+            return [keys[i:i + self.batch_size]
+                    for i in range(0, len(keys), self.batch_size)]
+
+    def run(self):
+        while True:
+            batches = self.take()
+            if batches is None:
+                return
+            for batch in batches:
+                self.executor.submit(self.send, batch)
+
+    def send(self, batch):
+        if self.limiter:
+            self.limiter.acquire()
+        try:
+            invalid = self.rest.purge(batch, self.domain)
+        except Exception as e:
+            log.debug("purge failed: {0}".format(e))
+            with self.cond:
+                for key in batch:
+                    self.failed[key] = e
+        else:
+            with self.cond:
+                self.invalid.extend(invalid)
@@ -1,75 +1,196 @@
 # -*- coding: utf-8 -*-
+import contextlib
+import io
 import os
+import stat
 
-from .modules.sign import make_signature,\
+from collections import namedtuple, OrderedDict
+from concurrent import futures
+from requests.packages.urllib3.fields import guess_content_type
+
+from .modules.sign import Signer,\
     make_content_md5, encode_msg, make_purge_signature
-from .modules.exception import UpYunClientException
+from .modules.exception import UpYunClientException, \
+    UpYunServiceException
 from .modules.compat import b, str, quote, urlencode, builtin_str
 from .modules.httpipe import cur_dt
+from .modules.parallel import imap_unordered, crawl, get_controller, \
+    is_parallel
+from .modules.retry import seekable
+from .modules.tuning import ThroughputMeter
 from .resume import UpYunResume
+from .multi import UpYunMultiUploader
+from .download import UpYunDownloader
+from .purge import PURGE_BATCH_SIZE
+
+PURGE_HOST = 'purge.upyun.com'
+MAX_BUFFER_SIZE = 4 * 1024 * 1024
+DEFAULT_CHUNKSIZE = 8192
+LIST_LIMIT = 10000
+LIST_ITER_EOF = 'g2gCZAAEbmV4dGQAA2VvZg'
+MISSING = object()
 
 
 def get_fileobj_size(fileobj):
-    if hasattr(fileobj, 'stream'):
-        return int(fileobj.getheader("Content-Length"))
+    """返回可读对象剩余的字节数, 无法确定时(管道, socket, 没有
+    Content-Length 或经过压缩的 HTTP 响应等)返回 None"""
+    if hasattr(fileobj, 'iter_content') or hasattr(fileobj, 'stream'):
+        headers = fileobj.headers
+        if headers.get('Content-Encoding', 'identity') != 'identity':
+            return None
+        try:
+            return int(headers['Content-Length'])
+        except (KeyError, TypeError, ValueError):
+            return None
 
     try:
         if hasattr(fileobj, 'fileno'):
-            return os.fstat(fileobj.fileno()).st_size
-    except IOError:
+            st = os.fstat(fileobj.fileno())
+            if not stat.S_ISREG(st.st_mode):
+                return None
+            return max(st.st_size - fileobj.tell(), 0)
+    except (IOError, OSError, ValueError):
         pass
 
-    return len(fileobj.getvalue())
+    if hasattr(fileobj, 'getvalue'):
+        return len(fileobj.getvalue()) - fileobj.tell()
+    return None
+
+
+class ListEntry(namedtuple('ListEntry', ['name', 'type', 'size', 'time'])):
+    """目录列表条目, 也支持 `item['name']` 形式访问"""
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, slice)):
+            return tuple.__getitem__(self, key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    @classmethod
+    def parse(cls, line):
+        name, type, size, time = line.split('\t')
+        return cls(name, type, int(size), int(time))
 
 
 class UploadObject(object):
-    def __init__(self, fileobj, chunksize=None, handler=None, params=None):
+    """流式上传的请求体, 每次最多读取 `chunksize` 字节, 内存占用与文件大小无关
+    :param fileobj: 可读对象, 包括文件, 管道, socket, urllib3 的
+        HTTPResponse (`.stream()`) 以及 requests 的 Response
+        (`.iter_content()`)
+    :param chunksize: 每次读取的大小
+    :param handler: 进度回调, `handler(totalsize, params)` 返回的对象
+        需要实现 `update(readsofar)` 和 `finish()`; 长度未知时 totalsize 为 None
+    :param params: 传给 handler 的参数
+    :param bandwidth: `BandwidthLimiter`, 按上传限速读取
+
+    长度已知时 `len()` 返回剩余字节数; 长度未知(`totalsize` 为 None)时
+    以 chunked 方式上传
+    """
+
+    def __init__(self, fileobj, chunksize=None, handler=None, params=None,
+                 bandwidth=None):
         self.fileobj = fileobj
-        self.chunksize = chunksize
+        self.bandwidth = bandwidth
+        self.chunksize = chunksize or DEFAULT_CHUNKSIZE
         self.totalsize = get_fileobj_size(fileobj)
         self.readsofar = 0
+        self.handler = handler
+        self.params = params
         self.hdr = None
+        self.chunks = None
+        self.buffer = b''
+        if hasattr(fileobj, 'iter_content'):
+            self.chunks = fileobj.iter_content(self.chunksize)
+        self.start = None
+        if self.chunks is None and seekable(fileobj):
+            self.start = fileobj.tell()
         if handler:
             self.hdr = handler(self.totalsize, params)
 
+    def seekable(self):
+        return self.start is not None
+
+    def tell(self):
+        return self.readsofar
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if self.start is None or whence != os.SEEK_SET:
+            raise io.UnsupportedOperation('only seek from start is supported')
+        self.fileobj.seek(self.start + offset, os.SEEK_SET)
+        self.readsofar = offset
+        if self.handler:
+            # 重试前回退时重新开始计算进度, 避免超过 100% 或提前 finish
+            self.hdr = self.handler(self.totalsize, self.params)
+            if offset:
+                self.hdr.update(offset)
+
     def __iter__(self):
-        if hasattr(self.fileobj, 'stream'):
-            yield self.fileobj.iter_content(self.chunksize)
-        else:
-            while True:
-                chunk = self.fileobj.read(self.chunksize)
-                if not chunk:
-                    break
-                yield chunk
+        while True:
+            chunk = self.read(self.chunksize)
+            if not chunk:
+                break
+            yield chunk
 
     def __next__(self):
-        chunk = self.fileobj.read(self.chunksize)
-        if chunk and self.hdr:
-            self.readsofar += len(chunk)
-            if self.readsofar != self.totalsize:
-                self.hdr.update(self.readsofar)
-            else:
-                self.hdr.finish()
+        chunk = self.read(self.chunksize)
+        if not chunk:
+            raise StopIteration
         return chunk
+    next = __next__
 
     def __len__(self):
+        if self.totalsize is None:
+            raise TypeError('unknown length')
         return self.totalsize
 
+    def read_chunks(self, size):
+        chunks, length = [self.buffer], len(self.buffer)
+        while length < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            chunks.append(chunk)
+            length += len(chunk)
+        data = b''.join(chunks)
+        self.buffer = data[size:]
+        return data[:size]
+
     def read(self, size=-1):
-        return self.__next__()
+        if size is None or size < 0:
+            size = self.chunksize
+        if self.chunks is not None:
+            chunk = self.read_chunks(size)
+        else:
+            chunk = self.fileobj.read(size)
+        self.readsofar += len(chunk)
+        if self.bandwidth is not None:
+            self.bandwidth.throttle_upload(len(chunk))
+        if self.hdr:
+            if chunk and self.readsofar != self.totalsize:
+                self.hdr.update(self.readsofar)
+            elif self.readsofar:
+                self.hdr.finish()
+                self.hdr = None
+        return chunk
 
 
 class UpYunRest(object):
     def __init__(self, service, username, password, auth_server,
-                 endpoint, chunksize, hp):
+                 endpoint, chunksize, hp, signer=None, cache=None):
         self.service = service
         self.username = username
         self.password = password
         self.auth_server = auth_server
+        self.signer = signer or Signer(username, password, auth_server)
         self.chunksize = chunksize
         self.endpoint = endpoint
         self.hp = hp
         self.host = None
+        self.cache = cache
+        self.throughput = ThroughputMeter()
 
     # --- public API
     def usage(self, key):
@@ -78,28 +199,32 @@ class UpYunRest(object):
 
     def _resume(self, key, f, file_size, checksum=None,
                 secret=None, headers=None, store=None,
-                reporter=None, part_size=None):
+                reporter=None, part_size=None, workers=None):
         if secret:
             headers = headers or {}
             headers['Content-Secret'] = secret
         resumer = UpYunResume(self, key, f, file_size,
-                              headers, checksum, store, reporter, part_size)
+                              headers, checksum, store, reporter, part_size,
+                              workers)
         return resumer.upload()
 
     def move(self, src, dest):
         source = '/%s/%s' % (self.service, src if src[0] != '/' else src[1:])
         headers = {"X-Upyun-Move-Source": source}
-        h = self.__do_http_request('PUT', dest, None, headers)
+        # 第一次请求成功但响应丢失时, 重试会因源文件已不存在而失败
+        h = self.__do_http_request('PUT', dest, None, headers,
+                                   idempotent=False)
         return self.__get_meta_headers(h)
 
     def copy(self, src, dest):
         source = '/%s/%s' % (self.service, src if src[0] != '/' else src[1:])
         headers = {"X-Upyun-Copy-Source": source}
-        h = self.__do_http_request('PUT', dest, None, headers)
+        h = self.__do_http_request('PUT', dest, None, headers,
+                                   idempotent=False)
         return self.__get_meta_headers(h)
 
     def put(self, key, value, checksum, headers, handler, params, secret,
-            need_resume, store, reporter, part_size):
+            need_resume, store, reporter, part_size, workers=None):
         """
         >>> with open('foo.png', 'rb') as f:
         >>>    res = up.put('/path/to/bar.png', f, checksum=False,
@@ -110,7 +235,8 @@ class UpYunRest(object):
             length = value.tell()
             value.seek(0, os.SEEK_SET)
             return self._resume(key, value, length, checksum, secret,
-                                headers, store, reporter, part_size)
+                                headers, store, reporter, part_size,
+                                workers)
 
         if headers is None:
             headers = {}
@@ -118,29 +244,84 @@ class UpYunRest(object):
         if isinstance(value, str):
             value = b(value)
 
+        if checksum is True and hasattr(value, 'read'):
+            length = get_fileobj_size(value)
+            if length is None:
+                raise UpYunClientException(
+                    'checksum needs an object of known size')
+            if length <= MAX_BUFFER_SIZE:
+                # 小文件一次读入内存, 计算 MD5 与上传共用同一份数据
+                value = value.read()
+                if handler:
+                    value = io.BytesIO(value)
+
         if checksum is True:
             headers['Content-MD5'] = make_content_md5(value, self.chunksize)
 
         if secret:
             headers['Content-Secret'] = secret
 
-        if hasattr(value, 'fileno'):
+        if not isinstance(value, UploadObject) and \
+                (hasattr(value, 'read') or hasattr(value, 'iter_content')):
             value = UploadObject(value, chunksize=self.chunksize,
-                                 handler=handler, params=params)
+                                 handler=handler, params=params,
+                                 bandwidth=self.hp.bandwidth)
 
         h = self.__do_http_request('PUT', key, value, headers)
         return self.__get_meta_headers(h)
 
-    def get(self, key, value, handler, params):
+    def put_multi(self, key, f, length=None, content_type=None):
+        """边读取边计算 MD5 的顺序分块上传, 由 complete 阶段的
+        `X-Upyun-Multi-MD5` 校验整个文件, 只需读取一次文件;
+        返回 complete 阶段的头部, 不包含图片的宽高等信息"""
+        if length is None:
+            length = get_fileobj_size(f)
+        headers = {'X-Upyun-Multi-Type':
+                   content_type or guess_content_type(key)}
+        uploader = UpYunMultiUploader(self, key, headers=headers,
+                                      file_size=length)
+        return uploader.upload_from(f, workers=1, checksum=True)
+
+    def get(self, key, value, handler, params, workers=None, part_size=None,
+            checksum=False, need_resume=False, store=None):
         '''
         >>> with open('bar.png', 'wb') as f:
         >>>    up.get('/path/to/bar.png', f)
         '''
+        if (need_resume or is_parallel(workers)) and \
+                hasattr(value, 'fileno'):
+            downloader = UpYunDownloader(self, key, value, workers,
+                                         part_size, checksum,
+                                         handler, params,
+                                         need_resume, store)
+            return downloader.download()
+
         return self.__do_http_request('GET', key, of=value, stream=True,
                                       handler=handler, params=params)
 
-    def delete(self, key):
-        self.__do_http_request('DELETE', key)
+    def get_stream(self, key, headers=None):
+        """返回未读取内容的 requests Response, 用于流式转存"""
+        uri, _, headers = self.make_request('GET', key, headers=headers)
+        return self.hp.do_http_pipe('GET', self.endpoint, uri,
+                                    headers=headers, stream=True,
+                                    sign=self.__make_sign(uri, 'GET'))
+
+    def delete(self, key, async_delete=False):
+        headers = {'x-upyun-async': 'true'} if async_delete else None
+        self.__do_http_request('DELETE', key, headers=headers)
+
+    def delete_many(self, keys, workers, async_delete=False):
+        """
+        >>> report = up.delete_many(['/a.png', '/b.png'], workers=10)
+        >>> failed = dict((k, e) for k, e in report.items() if e)
+        """
+        report = {}
+        with self.concurrency(workers) as workers:
+            for key, _, exc in imap_unordered(
+                    lambda key: self.delete(key, async_delete), keys,
+                    workers):
+                report[key] = exc
+        return report
 
     def mkdir(self, key):
         headers = {'Folder': 'true'}
@@ -157,45 +338,164 @@ class UpYunRest(object):
             if v is not None:
                 headers[k] = str(v)
         return headers
+    make_list_headers = __make_list_headers
 
     def getlist(self, key, limit, order, begin):
+        if self.cache is not None:
+            cache_key = ('list', self.__norm_key(key))
+            pages = self.cache.get(cache_key, count=False) or {}
+            items = pages.get((limit, order, begin))
+            # 只有请求的这一页在缓存中才算命中
+            self.cache.count(items is not None)
+            if items is not None:
+                return [dict(x) for x in items]
+
         headers = self.__make_list_headers(limit, order, begin)
         content = self.__do_http_request('GET', key, headers=headers)
         if content == '':
-            return []
-        items = content.split('\n')
-        return [dict(zip(['name', 'type', 'size', 'time'],
-                x.split('\t'))) for x in items]
+            items = []
+        else:
+            items = [self.parse_list_line(x) for x in content.split('\n')]
+
+        if self.cache is not None:
+            pages = dict(pages)
+            pages[(limit, order, begin)] = [dict(x) for x in items]
+            self.cache.set(cache_key, pages)
+        return items
 
     def get_list_with_iter(self, key, limit, order, begin):
-        headers = self.__make_list_headers(limit, order, begin)
-        resp = self.__do_http_request('GET', key, headers=headers,
-                                      with_headers=True)
-        ret = {'files': [], 'iter': None}
-        if resp['headers']:
-            ret['iter'] = dict(resp['headers']).get('x-upyun-list-iter')
-        if resp['content'] == '':
+        content, next_iter = self.__list_page(key, limit, order, begin)
+        ret = {'files': [], 'iter': next_iter}
+        if content == '':
             return ret
-        items = resp['content'].split('\n')
-        ret['files'] = [dict(zip(['name', 'type', 'size', 'time'],
-                                 x.split('\t'))) for x in items]
+        items = content.split('\n')
+        ret['files'] = [self.parse_list_line(x) for x in items]
         return ret
 
     def iterlist(self, key, limit, order, begin):
-        headers = self.__make_list_headers(limit, order, begin)
-        lines = self.__do_http_request('GET', key, headers=headers,
-                                       stream=True, iter_line=True)
-        for line in lines:
-            decoded_line = line.decode('utf-8')
-            yield dict(zip(['name', 'type', 'size', 'time'],
-                           decoded_line.split('\t')))
+        """
+        自动翻页, 在调用方处理当前页时后台预取下一页(最多预取一页);
+        提前结束遍历(break 或 close())时取消或等待预取的请求结束
+        >>> for item in up.iterlist('/path/to/'):
+        >>>     print(item.name, item.size)
+        """
+        limit = limit or LIST_LIMIT
+        executor = futures.ThreadPoolExecutor(max_workers=1)
+        next_page = None
+        try:
+            content, begin = self.__list_page(key, limit, order, begin)
+            while True:
+                next_page = None
+                if content and begin and begin != LIST_ITER_EOF:
+                    next_page = executor.submit(self.__list_page, key,
+                                                limit, order, begin)
+                for line in content.split('\n'):
+                    if line:
+                        yield ListEntry.parse(line)
+                if next_page is None:
+                    break
+                content, begin = next_page.result()
+                next_page = None
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+            # 等待已发出的预取请求结束, 生成器关闭后不再有请求在途
+            executor.shutdown(wait=True)
+
+    def walk(self, key, workers, limit=None, order=None):
+        """
+        >>> for path, item in up.walk('/path/to/', workers=10):
+        >>>     print(path, item['size'])
+        """
+        root = key.rstrip('/')
+
+        def list_page(task):
+            path, begin = task
+            res = self.get_list_with_iter(path or '/', limit or LIST_LIMIT,
+                                          order, begin)
+            children = [('%s/%s' % (path, item['name']), None)
+                        for item in res['files'] if item['type'] == 'F']
+            if res['files'] and res['iter'] and \
+                    res['iter'] != LIST_ITER_EOF:
+                children.append((path, res['iter']))
+            return res['files'], children
+
+        with self.concurrency(workers) as workers:
+            for (path, _), files, exc in crawl(list_page, [(root, None)],
+                                               workers):
+                if exc is not None:
+                    raise exc
+                for item in files:
+                    yield '%s/%s' % (path, item['name']), item
 
     def getinfo(self, key):
+        if self.cache is not None:
+            cache_key = ('info', self.__norm_key(key))
+            info = self.cache.get(cache_key)
+            if info is not None:
+                return dict(info)
+
         h = self.__do_http_request('HEAD', key)
-        return self.__get_meta_headers(h)
+        info = self.__get_meta_headers(h)
+        if self.cache is not None:
+            self.cache.set(cache_key, dict(info))
+        return info
+
+    def getinfo_many(self, keys, workers, cache=None):
+        """
+        >>> infos = up.getinfo_many(keys, workers=20, cache=TTLCache())
+        >>> missing = [k for k, info in infos.items() if info is None]
+        """
+        def getinfo(key):
+            try:
+                info = self.getinfo(key)
+            except UpYunServiceException as e:
+                if e.status != 404:
+                    raise
+                info = None
+            if cache is not None:
+                cache.set(key, info)
+            return info
+
+        report = {}
+        todo = []
+        for key in keys:
+            info = cache.get(key, MISSING) if cache is not None else MISSING
+            if info is MISSING:
+                todo.append(key)
+            else:
+                report[key] = info
+        with self.concurrency(workers) as workers:
+            for key, info, exc in imap_unordered(getinfo, todo, workers):
+                report[key] = exc if exc is not None else info
+        return report
 
-    def purge(self, keys, domain):
+    def purge(self, keys, domain, batch_size=PURGE_BATCH_SIZE):
         domain = domain or '%s.b0.upaiyun.com' % (self.service)
+        if isinstance(keys, builtin_str):
+            keys = [keys]
+        if not isinstance(keys, list):
+            raise UpYunClientException('keys type error')
+        keys = list(OrderedDict.fromkeys(keys))
+        invalid = []
+        for i in range(0, len(keys), batch_size):
+            invalid.extend(self.__purge(keys[i:i + batch_size], domain))
+        return invalid
+
+    def __purge(self, keys, domain):
+        method = 'POST'
+        uri = '/purge/'
+        params, headers = self.make_purge_request(keys, domain)
+        # 重复刷新没有副作用, 按幂等请求重试
+        resp = self.hp.do_http_pipe(method, PURGE_HOST, uri,
+                                    value=params, headers=headers,
+                                    sign=lambda h: self.make_purge_request(
+                                        keys, domain)[1],
+                                    idempotent=True)
+        content = self.__handle_resp(resp, method, uri=uri)
+        return self.parse_purge_response(content, domain)
+
+    def make_purge_request(self, keys, domain):
         if isinstance(keys, builtin_str):
             keys = [keys]
         if isinstance(keys, list):
@@ -205,25 +505,22 @@ class UpYunRest(object):
         else:
             raise UpYunClientException('keys type error')
 
-        method = 'POST'
-        host = 'purge.upyun.com'
-        uri = '/purge/'
         params = urlencode({'purge': urlstr})
         headers = {'Content-Type': 'application/x-www-form-urlencoded',
                    'Accept': 'application/json'}
         self.__set_auth_headers(urlstr, headers=headers, is_purge=True)
+        return params, headers
 
-        resp = self.hp.do_http_pipe(method, host, uri,
-                                    value=params, headers=headers)
-        content = self.__handle_resp(resp, method, uri=uri)
+    @staticmethod
+    def parse_purge_response(content, domain):
         invalid_urls = content['invalid_domain_of_url']
         return [k[7 + len(domain):] for k in invalid_urls if k]
 
-    # --- private API
-    def __do_http_request(self, method=None, key=None,
-                          value=None, headers=None, of=None, args='',
-                          stream=False, handler=None,
-                          params=None, iter_line=False, with_headers=False):
+    @staticmethod
+    def parse_list_line(line):
+        return dict(zip(['name', 'type', 'size', 'time'], line.split('\t')))
+
+    def make_request(self, method, key, value=None, headers=None, args=''):
         _uri = '/%s/%s' % (self.service, key if key[0] != '/' else key[1:])
         uri = '%s%s' % (quote(encode_msg(_uri), safe='~/'), args)
 
@@ -234,29 +531,83 @@ class UpYunRest(object):
             headers["HOST"] = self.host
 
         length = 0
-        if hasattr(value, '__len__'):
+        if isinstance(value, UploadObject):
+            length = value.totalsize
+            if length is None:
+                # 长度未知, 交给 requests 以 chunked 方式上传
+                value = iter(value)
+        elif hasattr(value, '__len__'):
             length = len(value)
-            headers['Content-Length'] = str(length)
         elif hasattr(value, 'fileno'):
             length = get_fileobj_size(value)
-            headers['Content-Length'] = str(length)
-            # [ugly]:compatible with newest requests feature
-            # force the stream upload with empty file to normal upload
-            if not length:
-                value = ''
         elif value is not None:
             raise UpYunClientException('object type error')
 
+        if length is not None and value is not None:
+            headers['Content-Length'] = str(length)
+            # 空的流式请求体会被 requests 当作 chunked 上传
+            if not length:
+                value = b''
+
         self.__set_auth_headers(uri, method, length, headers)
+        return uri, value, headers
 
-        resp = self.hp.do_http_pipe(method, self.endpoint, uri,
-                                    value, headers, stream)
-        return self.__handle_resp(resp, method, of, handler,
-                                  params, iter_line=iter_line,
-                                  with_headers=with_headers)
+    # --- private API
+    def __list_page(self, key, limit, order, begin):
+        headers = self.__make_list_headers(limit, order, begin)
+        resp = self.__do_http_request('GET', key, headers=headers,
+                                      with_headers=True)
+        next_iter = None
+        if resp['headers']:
+            next_iter = dict(resp['headers']).get('x-upyun-list-iter')
+        return resp['content'], next_iter
+
+    def __do_http_request(self, method=None, key=None,
+                          value=None, headers=None, of=None, args='',
+                          stream=False, handler=None,
+                          params=None, iter_line=False, with_headers=False,
+                          retry=None, idempotent=None):
+        dirty = []
+        if self.cache is not None and method in ('PUT', 'POST', 'DELETE'):
+            dirty.append(key)
+            source = (headers or {}).get('X-Upyun-Move-Source')
+            if source:
+                dirty.append(source[len(self.service) + 1:])
+
+        try:
+            uri, value, headers = self.make_request(method, key, value,
+                                                    headers, args)
+            resp = self.hp.do_http_pipe(method, self.endpoint, uri,
+                                        value, headers, stream,
+                                        sign=self.__make_sign(uri, method),
+                                        retry=retry, idempotent=idempotent)
+            return self.__handle_resp(resp, method, of, handler,
+                                      params, iter_line=iter_line,
+                                      with_headers=with_headers)
+        finally:
+            for k in dirty:
+                self.__invalidate(k)
 
     do_http_request = __do_http_request
 
+    @staticmethod
+    def __norm_key(key):
+        return '/' + key.strip('/')
+
+    def __invalidate(self, key):
+        """写操作后清除该文件的信息缓存, 以及自身和所有上级目录的列表缓存
+        (上传时会自动创建上级目录)"""
+        if self.cache is None:
+            return
+        key = self.__norm_key(key)
+        self.cache.delete(('info', key))
+        while True:
+            self.cache.delete(('list', key))
+            if key == '/':
+                break
+            key = key.rsplit('/', 1)[0] or '/'
+    invalidate = __invalidate
+
     def __handle_resp(self, resp, method=None, of=None,
                       handler=None, params=None, uri=None,
                       iter_line=False, with_headers=False):
@@ -282,6 +633,8 @@ class UpYunRest(object):
                             hdr.finish()
                     if not chunk:
                         break
+                    if self.hp.bandwidth is not None:
+                        self.hp.bandwidth.throttle_download(len(chunk))
                     of.write(chunk)
             elif method == 'GET' and iter_line:
                 content = resp.iter_lines()
@@ -311,6 +664,27 @@ class UpYunRest(object):
         return heads
     get_meta_headers = __get_meta_headers
 
+    @contextlib.contextmanager
+    def concurrency(self, workers):
+        """`workers` 为 'auto' 或 `ConcurrencyController` 时, 在任务期间把
+        控制器注册为请求回调, 使其感知被重试掩盖的 429, 5xx 及超时; 多个
+        任务共享同一个控制器时, 最后一个任务结束才注销;
+        'auto' 的并发数上限为连接池大小, 避免超出后反复新建连接"""
+        controller = get_controller(workers, self.hp.pool_maxsize)
+        registered = controller is not None and \
+            self.hp.acquire_hook(controller)
+        try:
+            yield controller or workers
+        finally:
+            if registered:
+                self.hp.release_hook(controller)
+
+    def __make_sign(self, uri, method):
+        """重试时使用新的 Date 重新签名"""
+        def sign(headers):
+            return self.__set_auth_headers(uri, method, headers=headers)
+        return sign
+
     def __set_auth_headers(self, playload, method=None,
                            length=0, headers=None, is_purge=False):
         if headers is None:
@@ -318,11 +692,8 @@ class UpYunRest(object):
 
         dt = cur_dt()
         if not is_purge:
-            signature = make_signature(username=self.username,
-                                       password=self.password,
-                                       auth_server=self.auth_server,
-                                       method=method, uri=playload, date=dt,
-                                       content_md5=headers.get('Content-MD5'))
+            signature = self.signer.sign(
+                method, playload, dt, content_md5=headers.get('Content-MD5'))
         else:
             signature = make_purge_signature(self.service, self.username,
                                              self.password, playload, dt)
@@ -1,12 +1,15 @@
 # -*- coding: utf-8 -*-
-import collections
 import hashlib
 import logging
 import os
 import errno
 
 from requests.packages.urllib3.fields import guess_content_type
-from .modules.sign import decode_msg
+from .modules.sign import decode_msg, make_content_md5
+from .modules.parallel import imap_unordered, is_parallel
+from .modules.tuning import choose_part_size
+from .multi import UpYunMultiUploader, PART_SIZE, map_file, close_map, \
+    release_part
 
 from .modules.compat import b, stringify
 from .modules.exception import UpYunResumeTraceException, UpYunServiceException
@@ -19,7 +22,6 @@ except (ImportError, SyntaxError):
 TEMP_DIR = '.up-python-resume'
 DEFAULT_CHUNKSIZE = 8192
 THRESHOLD = 5 * 1024 * 1024
-PART_SIZE = 1024 * 1024
 log = logging.getLogger(__name__)
 
 
@@ -109,10 +111,11 @@ memory_store = MemoryStore()
 
 class ResumeTrace(object):
     def __init__(self, service, key, filename, file_md5, file_size,
-                 store=None):
+                 store=None, disorder=False):
         self.store = store if store else memory_store
         self.file_md5 = file_md5
         self.file_size = file_size
+        self.disorder = disorder
         self.store_key = self.store.get_key(service, key, filename)
         self.record = UpYunRecord(self.store.get(self.store_key))
         try:
@@ -128,14 +131,20 @@ class ResumeTrace(object):
             raise UpYunResumeTraceException(
                 msg="get value error:" + str(record))
 
-        if not isinstance(record.next_id, int):
+        if self.disorder:
+            self.check_disorder(record)
+        elif not isinstance(record.next_id, int):
             raise UpYunResumeTraceException(msg="next_id error")
+        elif record.part_size is not None and \
+                not isinstance(record.part_size, int):
+            raise UpYunResumeTraceException(msg="part_size error")
         elif record.next_id == -1:
             raise UpYunResumeTraceException(msg="old file recode not deleted")
-
-        for key in ("start", "end"):
-            if not isinstance(record.get(key), int):
-                raise UpYunResumeTraceException(msg="{} error".format(key))
+        else:
+            for key in ("start", "end"):
+                if not isinstance(record.get(key), int):
+                    raise UpYunResumeTraceException(
+                        msg="{} error".format(key))
 
         if not isinstance(record.multi_uuid, str):
             raise UpYunResumeTraceException(msg="multi_uuid error")
@@ -146,6 +155,17 @@ class ResumeTrace(object):
         if self.file_size != record.file_size:
             raise UpYunResumeTraceException(msg="file size changed")
 
+    @staticmethod
+    def check_disorder(record):
+        if not record.disorder:
+            raise UpYunResumeTraceException(msg="not a disorder record")
+
+        if not isinstance(record.part_size, int):
+            raise UpYunResumeTraceException(msg="part_size error")
+
+        if not isinstance(record.parts, list):
+            raise UpYunResumeTraceException(msg="parts error")
+
     def get(self):
         return self.record
 
@@ -183,8 +203,9 @@ class UpYunRecord(dict):
 
 
 class SizedFile(object):
-    def __init__(self, file_object, start, end):
+    def __init__(self, file_object, start, end, bandwidth=None):
         self.file_object = file_object
+        self.bandwidth = bandwidth
         self.end = end
         self.start = start
         self.size = end - start
@@ -194,7 +215,21 @@ class SizedFile(object):
         self.file_object.seek(self.start, os.SEEK_SET)
         self.offset = 0
 
+    def tell(self):
+        return self.offset
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self.file_object.seek(self.start + offset, os.SEEK_SET)
+        self.offset = offset
+
     def read(self, chunk=None):
+        if self.bandwidth is not None:
+            data = self.__read(chunk)
+            self.bandwidth.throttle_upload(len(data))
+            return data
+        return self.__read(chunk)
+
+    def __read(self, chunk=None):
         if self.offset >= self.size:
             return b''
 
@@ -211,7 +246,7 @@ class SizedFile(object):
 
     def get_md5(self, chunksize=DEFAULT_CHUNKSIZE):
         md5 = hashlib.md5()
-        for chunk in iter(lambda: self.read(chunksize), b''):
+        for chunk in iter(lambda: self.__read(chunksize), b''):
             md5.update(chunk)
         self.reset()
         return md5.hexdigest()
@@ -243,21 +278,32 @@ class UpYunResume(object):
     :param headers: 传给 `initiate_upload` 的 HTTP 头部
     :param checksum: 默认 False，表示不进行 MD5 校验
     :param store: BaseStore 实例, 默认采用 memory_store
+    :param workers: 并发上传的线程数, 大于 1 时采用并行式断点续传;
+        为 'auto' 或 `ConcurrencyController` 时自动调整
     """
 
     def __init__(self, rest, key, f, file_size,
                  headers=None, checksum=False, store=None,
-                 reporter=None, part_size=None):
+                 reporter=None, part_size=None, workers=None):
         self.key = key
         self.rest = rest
         self.f = f
         self.file_size = file_size
-        self.part_size = part_size
-        if not part_size:
-            self.part_size = PART_SIZE
+        self.part_size = choose_part_size(file_size, rest.throughput,
+                                          part_size, workers,
+                                          rest.hp.pool_maxsize)
+        self.workers = workers or 1
+        self.disorder = (is_parallel(self.workers) and
+                         self.file_size > self.part_size)
+        self.mapped = map_file(f)
         self.file_md5 = self.make_md5() if checksum else ""
         self.trace = ResumeTrace(self.rest.service, key, f.name,
-                                 self.file_md5, file_size, store)
+                                 self.file_md5, file_size, store,
+                                 self.disorder)
+        record = self.trace.get()
+        if record:
+            # 续传时沿用记录中的分块大小, 旧的顺序记录没有保存, 为 1M
+            self.part_size = record.part_size or PART_SIZE
         self.headers = headers or {}
         self.checksum = checksum
         self.init_headers(f.name)
@@ -265,11 +311,21 @@ class UpYunResume(object):
 
     def make_md5(self, chunksize=DEFAULT_CHUNKSIZE):
         md5 = hashlib.md5()
-        for chunk in iter(lambda: self.f.read(chunksize), b''):
-            md5.update(chunk)
-        self.f.seek(0)
+        if self.mapped is not None:
+            md5.update(self.mapped)
+        else:
+            for chunk in iter(lambda: self.f.read(chunksize), b''):
+                md5.update(chunk)
+            self.f.seek(0)
         return decode_msg(md5.hexdigest())
 
+    def read_part(self, start, end):
+        """返回 [start, end) 的数据, 已映射时为零拷贝的 memoryview 切片"""
+        if self.mapped is not None:
+            return memoryview(self.mapped)[start:end]
+        self.f.seek(start, os.SEEK_SET)
+        return SizedFile(self.f, start, end, self.rest.hp.bandwidth)
+
     def init_headers(self, filename):
         if "X-Upyun-Multi-Type" not in self.headers:
             self.headers["X-Upyun-Multi-Type"] = guess_content_type(filename)
@@ -321,7 +377,8 @@ class UpYunResume(object):
             log.debug("init file")
             record.update({
                 "next_id": 0, "file_size": self.file_size,
-                "file_md5": self.file_md5, "start": 0,
+                "file_md5": self.file_md5, "part_size": self.part_size,
+                "start": 0,
                 "end": self.part_size if self.part_size < self.file_size
                 else self.file_size})
             headers.update(self.headers)
@@ -333,13 +390,18 @@ class UpYunResume(object):
                 stage + ",complete" if stage else "complete"
             if self.checksum:
                 headers["X-Upyun-Multi-MD5"] = self.file_md5
-        self.f.seek(record.start, os.SEEK_SET)
-        value = SizedFile(self.f, record.start, record.end)
+        value = self.read_part(record.start, record.end)
         if self.checksum:
-            headers["Content-MD5"] = value.get_md5()
+            headers["Content-MD5"] = value.get_md5() \
+                if isinstance(value, SizedFile) else make_content_md5(value)
         log.debug("{0:>20}, part_id:{1:>10}, uuid:{2}".format(
             "upload file", record.next_id, record.multi_uuid))
-        return dict(method="PUT", headers=headers, key=self.key, value=value)
+        # initiate 会创建新的上传, complete 后上传记录即失效, 均不是幂等请求
+        stage = headers.get("X-Upyun-Multi-Stage", "")
+        idempotent = False if "initiate" in stage or "complete" in stage \
+            else None
+        return dict(method="PUT", headers=headers, key=self.key, value=value,
+                    idempotent=idempotent)
 
     def step(self, res, record):
         if not record.multi_uuid:
@@ -362,11 +424,21 @@ class UpYunResume(object):
             return False
 
     def upload(self):
+        try:
+            if self.disorder:
+                return self.upload_disorder()
+            return self.upload_sequential()
+        finally:
+            if self.mapped is not None:
+                close_map(self.mapped)
+
+    def upload_sequential(self):
         while True:
             with self.trace as record:
                 req = self.get_request(record)
                 try:
-                    res = self.rest.do_http_request(**req)
+                    res = self.rest.throughput.measure(
+                        len(req['value']), self.rest.do_http_request, **req)
                 except UpYunServiceException as e:
                     try:
                         reason = stringify(json.loads(e.err))
@@ -382,7 +454,8 @@ class UpYunResume(object):
                             record.end = self.file_size
                         elif reason['msg'] == "file already upload":
                             record.next_id = -1
-                            return e.headers
+                            return self.rest.get_meta_headers(
+                                e.headers or [])
                         elif reason['msg'] in (
                                 "x-upyun-multi-uuid not found",
                                 "file md5 not match"):
@@ -393,9 +466,93 @@ class UpYunResume(object):
                             raise e
                 else:
                     done = self.step(res, record)
-                    if isinstance(
-                            self.progress_reporter, collections.Callable):
+                    if callable(self.progress_reporter):
                         self.progress_reporter(
                             record.start or 0, self.file_size, done)
                     if done:
-                        return res
+                        return self.rest.get_meta_headers(res)
+                finally:
+                    release_part(req['value'])
+
+    def init_disorder(self, record):
+        if record:
+            log.debug("{0:>20}, parts:{1:>10}, uuid:{2}".format(
+                "load record", len(record.parts), record.multi_uuid))
+            self.part_size = record.part_size
+            return UpYunMultiUploader(self.rest, self.key,
+                                      part_size=self.part_size,
+                                      file_size=self.file_size,
+                                      upload_id=record.multi_uuid)
+
+        log.debug("init file")
+        headers = dict((k, v) for k, v in self.headers.items()
+                       if k not in ("X-Upyun-Multi-Stage", "X-Upyun-Part-Id"))
+        uploader = UpYunMultiUploader(self.rest, self.key, headers=headers,
+                                      part_size=self.part_size,
+                                      file_size=self.file_size)
+        record.update({
+            "disorder": True, "multi_uuid": uploader.upload_id,
+            "file_size": self.file_size, "file_md5": self.file_md5,
+            "part_size": self.part_size, "parts": []})
+        self.trace.commit()
+        return uploader
+
+    def iter_parts(self, part_ids):
+        for part_id in part_ids:
+            start = part_id * self.part_size
+            end = min(start + self.part_size, self.file_size)
+            if self.mapped is not None:
+                yield part_id, self.read_part(start, end)
+            else:
+                self.f.seek(start, os.SEEK_SET)
+                yield part_id, self.f.read(end - start)
+
+    def upload_disorder(self):
+        record = self.trace.get()
+        uploader = self.init_disorder(record)
+        count = (self.file_size + self.part_size - 1) // self.part_size
+        done = set(record.parts)
+        uploaded_size = sum(min(self.part_size,
+                                self.file_size - i * self.part_size)
+                            for i in done)
+
+        def upload_part(part):
+            try:
+                uploader.upload_part(part[0], part[1], checksum=self.checksum)
+                return len(part[1])
+            finally:
+                release_part(part[1])
+
+        parts = self.iter_parts(i for i in range(count) if i not in done)
+        try:
+            with self.rest.concurrency(self.workers) as workers:
+                results = imap_unordered(upload_part, parts, workers)
+                try:
+                    for part, size, exc in results:
+                        if exc is not None:
+                            if isinstance(exc, UpYunServiceException) and \
+                                    "x-upyun-multi-uuid not found" in \
+                                    (exc.err or ""):
+                                log.debug("x-upyun-multi-uuid not found")
+                                self.trace.delete()
+                            raise exc
+                        record.parts.append(part[0])
+                        self.trace.commit()
+                        uploaded_size += size
+                        log.debug("{0:>20}, part_id:{1:>10}, uuid:{2}".format(
+                            "upload file", part[0], record.multi_uuid))
+                        if callable(self.progress_reporter):
+                            self.progress_reporter(uploaded_size,
+                                                   self.file_size, False)
+                finally:
+                    # 等待在途分块结束, 丢弃尚未发送的分块
+                    results.close()
+        finally:
+            parts.close()
+
+        res = uploader.complete(self.file_md5 if self.checksum else None)
+        log.debug("upload done")
+        self.trace.delete()
+        if callable(self.progress_reporter):
+            self.progress_reporter(self.file_size, self.file_size, True)
+        return res
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import os
+
+from .resume import memory_store
+from .modules.exception import UpYunClientException, \
+    UpYunServiceException
+from .modules.parallel import imap_unordered, get_controller, \
+    DEFAULT_WORKERS
+
+DEFAULT_CHUNKSIZE = 8192
+log = logging.getLogger(__name__)
+
+
+def file_md5(path, chunksize=DEFAULT_CHUNKSIZE):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunksize), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+class UpYunSync(object):
+    """本地目录与云存储目录同步
+    :param up: UpYun 实例
+    :param local_dir: 本地目录
+    :param remote_prefix: 云存储目录
+    :param workers: 并发线程数, 'auto' 表示自动调整, 同步过程中共用一个控制器
+    :param delete: 是否删除目标端多余的文件
+    :param checksum: 大小相同而修改时间变化时, 是否比较 MD5
+    :param store: BaseStore 实例, 保存上次同步的文件清单, 默认采用 memory_store
+
+    清单中每个文件记录为 [大小, 本地修改时间, MD5, 远端修改时间]
+    """
+
+    def __init__(self, up, local_dir, remote_prefix, workers=DEFAULT_WORKERS,
+                 delete=False, checksum=False, store=None):
+        if not os.path.isdir(local_dir):
+            raise UpYunClientException('local dir not found')
+        self.up = up
+        self.local_dir = os.path.abspath(local_dir)
+        self.remote_prefix = '/' + remote_prefix.strip('/')
+        self.workers = get_controller(workers, up.hp.pool_maxsize) or workers
+        self.delete = delete
+        self.checksum = checksum
+        self.store = store if store else memory_store
+        self.store_key = self.store.get_key(
+            up.service, self.remote_prefix, 'sync:%s' % self.local_dir)
+        self.manifest = self.store.get(self.store_key)
+
+    def remote_key(self, rel):
+        return '%s/%s' % (self.remote_prefix.rstrip('/'), rel)
+
+    def local_path(self, rel):
+        return os.path.join(self.local_dir, *rel.split('/'))
+
+    def list_local(self):
+        files = {}
+        for root, _, names in os.walk(self.local_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, self.local_dir)
+                st = os.stat(path)
+                files[rel.replace(os.sep, '/')] = (st.st_size,
+                                                   int(st.st_mtime))
+        return files
+
+    def list_remote(self):
+        files = {}
+        start = len(self.remote_prefix.rstrip('/')) + 1
+        try:
+            for path, item in self.up.walk(self.remote_prefix, self.workers):
+                if item['type'] != 'F':
+                    files[path[start:]] = (int(item['size']),
+                                           int(item['time']))
+        except UpYunServiceException as e:
+            # 云存储目录不存在时视为空目录
+            if e.status != 404 or files:
+                raise
+        return files
+
+    def is_changed(self, rel, local, remote, manifest, source_newer):
+        if local is None or remote is None or local[0] != remote[0]:
+            return True
+
+        md5 = None
+        entry = self.manifest.get(rel)
+        # 刚上传的文件还不知道远端修改时间, 以本次列表中的时间为准
+        if entry and entry[0] == local[0] and entry[1] == local[1] and \
+                entry[3] in (None, remote[1]):
+            same, md5 = True, entry[2]
+        elif self.checksum:
+            md5 = entry[2] if entry and entry[1] == local[1] else None
+            md5 = md5 or file_md5(self.local_path(rel))
+            info = self.up.getinfo(self.remote_key(rel))
+            same = md5 == (info.get('content-md5') or
+                           info.get('etag', '').strip('"'))
+        else:
+            same = not source_newer
+
+        if same:
+            manifest[rel] = [local[0], local[1], md5, remote[1]]
+        return not same
+
+    def sync_files(self, sources, changed, transfer, report, done):
+        todo = []
+        for rel, result, exc in imap_unordered(changed, sources,
+                                               self.workers):
+            if exc is not None:
+                report['failed'][rel] = exc
+            elif result:
+                todo.append(rel)
+            else:
+                report['skipped'] += 1
+
+        for rel, _, exc in imap_unordered(transfer, todo, self.workers):
+            if exc is not None:
+                report['failed'][rel] = exc
+            else:
+                done.append(rel)
+
+    def upload(self):
+        """上传本地新增或变化的文件"""
+        local, remote = self.list_local(), self.list_remote()
+        report = {'uploaded': [], 'downloaded': [], 'deleted': [],
+                  'skipped': 0, 'failed': {}}
+        manifest = {}
+
+        def changed(rel):
+            return self.is_changed(
+                rel, local[rel], remote.get(rel), manifest,
+                rel in remote and local[rel][1] > remote[rel][1])
+
+        def upload_file(rel):
+            with open(self.local_path(rel), 'rb') as f:
+                self.up.put(self.remote_key(rel), f)
+            manifest[rel] = [local[rel][0], local[rel][1], None, None]
+
+        self.sync_files(list(local), changed, upload_file, report,
+                        report['uploaded'])
+
+        if self.delete:
+            extra = [rel for rel in remote if rel not in local]
+            result = self.up.delete_many(
+                [self.remote_key(rel) for rel in extra], self.workers)
+            for rel in extra:
+                exc = result[self.remote_key(rel)]
+                if exc is not None:
+                    report['failed'][rel] = exc
+                else:
+                    report['deleted'].append(rel)
+
+        self.save(manifest)
+        return report
+
+    def download(self):
+        """下载云存储上新增或变化的文件"""
+        local, remote = self.list_local(), self.list_remote()
+        report = {'uploaded': [], 'downloaded': [], 'deleted': [],
+                  'skipped': 0, 'failed': {}}
+        manifest = {}
+
+        def changed(rel):
+            return self.is_changed(
+                rel, local.get(rel), remote[rel], manifest,
+                rel in local and remote[rel][1] > local[rel][1])
+
+        def download_file(rel):
+            path = self.local_path(rel)
+            dirname = os.path.dirname(path)
+            if not os.path.isdir(dirname):
+                try:
+                    os.makedirs(dirname)
+                except OSError:
+                    if not os.path.isdir(dirname):
+                        raise
+            with open(path, 'wb') as f:
+                self.up.get(self.remote_key(rel), f)
+            mtime = remote[rel][1]
+            os.utime(path, (mtime, mtime))
+            manifest[rel] = [remote[rel][0], mtime, None, mtime]
+
+        self.sync_files(list(remote), changed, download_file, report,
+                        report['downloaded'])
+
+        if self.delete:
+            for rel in local:
+                if rel not in remote:
+                    try:
+                        os.remove(self.local_path(rel))
+                    except OSError as e:
+                        report['failed'][rel] = e
+                    else:
+                        report['deleted'].append(rel)
+
+        self.save(manifest)
+        return report
+
+    def save(self, manifest):
+        log.debug("save sync manifest: {0} files".format(len(manifest)))
+        self.manifest = manifest
+        self.store.set(self.store_key, manifest)
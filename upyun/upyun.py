@@ -2,15 +2,22 @@
 import hashlib
 import os
 
-from .rest import UpYunRest
+import requests
+from requests.packages.urllib3.fields import guess_content_type
+
+from .rest import UpYunRest, UploadObject, get_fileobj_size
 from .form import FormUpload
 from .av import AvPretreatment
-from .multi import UpYunMultiUploader
+from .multi import UpYunMultiUploader, PART_SIZE
+from .sync import UpYunSync
+from .purge import PurgeQueue, PURGE_BATCH_SIZE, PURGE_WINDOW
+from .modules.parallel import DEFAULT_WORKERS
+from .modules.cache import TTLCache
 
 from .modules.httpipe import UpYunHttp
 from .modules.exception import UpYunClientException
 from .modules.compat import b
-from .modules.sign import make_signature
+from .modules.sign import make_signature, Signer
 
 ED_LIST = ('v%d.api.upyun.com' % ed for ed in range(4))
 ED_AUTO, ED_TELECOM, ED_CNC, ED_CTT = ED_LIST
@@ -22,14 +29,23 @@ class UpYun(object):
     def __init__(self, service, username=None, password=None,
                  auth_server=None, timeout=None, endpoint=None,
                  chunksize=None, debug=False, read_timeout=None,
-                 encrypt_pwd=None):
+                 encrypt_pwd=None, pool_connections=None, pool_maxsize=None,
+                 pool_block=False, max_retries=None, signer=None,
+                 cache=None, retry=None, hooks=None, bandwidth=None):
         super(UpYun, self).__init__()
         self.service = service or os.getenv('UPYUN_SERVICE')
-        self.username = username or os.getenv('UPYUN_USERNAME')
-        password = password or os.getenv('UPYUN_PASSWORD')
-        self.password = (hashlib.md5(b(password)).hexdigest()
-                         if password else encrypt_pwd)
-        self.auth_server = auth_server
+        if signer is not None:
+            self.username = signer.username
+            self.password = signer.password
+            self.auth_server = signer.auth_server
+        else:
+            self.username = username or os.getenv('UPYUN_USERNAME')
+            password = password or os.getenv('UPYUN_PASSWORD')
+            self.password = (hashlib.md5(b(password)).hexdigest()
+                             if password else encrypt_pwd)
+            self.auth_server = auth_server
+            signer = Signer(self.username, self.password, self.auth_server)
+        self.signer = signer
         self.endpoint = endpoint or ED_AUTO
         self.chunksize = chunksize or DEFAULT_CHUNKSIZE
         self.timeout = timeout or 60
@@ -37,28 +53,32 @@ class UpYun(object):
             self.requests_timeout = (self.timeout, read_timeout)
         else:
             self.requests_timeout = self.timeout
-        self.hp = UpYunHttp(self.requests_timeout, debug)
-
+        self.hp = UpYunHttp(self.requests_timeout, debug,
+                            pool_connections=pool_connections,
+                            pool_maxsize=pool_maxsize,
+                            pool_block=pool_block,
+                            max_retries=max_retries,
+                            retry=retry,
+                            hooks=hooks, bandwidth=bandwidth)
+
+        self.cache = TTLCache() if cache is True else cache
         self.up_rest = UpYunRest(self.service, self.username, self.password,
                                  self.auth_server, self.endpoint,
-                                 self.chunksize, self.hp)
+                                 self.chunksize, self.hp, signer, self.cache)
         self.av = AvPretreatment(self.service, self.username, self.password,
-                                 self.auth_server, self.chunksize, self.hp)
+                                 self.auth_server, self.chunksize, self.hp,
+                                 signer)
         self.up_form = FormUpload(self.service, self.username, self.password,
-                                  self.auth_server, self.endpoint, self.hp)
+                                  self.auth_server, self.endpoint, self.hp,
+                                  signer)
 
-        if debug:
+        if self.hp.debug:
             self.__init_debug_log(service=service, username=username,
-                                  password=password, auth_server=auth_server,
-                                  timeout=timeout, endpoint=endpoint,
-                                  chunksize=chunksize, debug=debug)
+                                  auth_server=auth_server, timeout=timeout,
+                                  endpoint=endpoint, chunksize=chunksize)
 
     def __init_debug_log(self, **kwargs):
-        with open('debug.log', 'w') as f:
-            f.write('### Running in debug mode ###\n\n\n')
-            f.write('## Initial params ##\n\n')
-            f.write('\n'.join(
-                map(lambda kv: '%s: %s' % (kv[0], kv[1]), kwargs.items())))
+        self.hp.debug.write('Initial params', sorted(kwargs.items()))
 
     def set_endpoint(self, endpoint, host=None):
         self.up_rest.endpoint = endpoint
@@ -100,25 +120,97 @@ class UpYun(object):
     def put(self, key, value, checksum=False, headers=None,
             handler=None, params=None, secret=None,
             need_resume=False, store=None, reporter=None, part_size=None,
-            form=False, expiration=None, **kwargs):
+            form=False, expiration=None, workers=None, **kwargs):
         if form and hasattr(value, 'fileno'):
-            return self.up_form.upload(key, value, expiration, **kwargs)
+            try:
+                return self.up_form.upload(key, value, expiration, **kwargs)
+            finally:
+                self.up_rest.invalidate(key)
         return self.up_rest.put(key, value, checksum, headers, handler,
                                 params, secret, need_resume,
-                                store, reporter, part_size)
+                                store, reporter, part_size, workers)
+
+    def put_multi(self, key, value, content_type=None):
+        return self.up_rest.put_multi(key, value, content_type=content_type)
 
     def init_multi_uploader(self, key, headers=None, part_size=None,
-                            file_size=None, upload_id=None):
+                            file_size=None, upload_id=None, workers=None):
         uploader = UpYunMultiUploader(self.up_rest, key, headers=headers,
                                       part_size=part_size, file_size=file_size,
-                                      upload_id=upload_id)
+                                      upload_id=upload_id, workers=workers)
         return uploader
 
-    def get(self, key, value=None, handler=None, params=None):
-        return self.up_rest.get(key, value, handler, params)
-
-    def delete(self, key):
-        self.up_rest.delete(key)
+    def upload_file(self, path, key, workers=DEFAULT_WORKERS, part_size=None,
+                    headers=None, checksum=True, retries=None):
+        file_size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            if file_size <= (part_size or PART_SIZE):
+                return self.put(key, f, checksum=checksum, headers=headers)
+
+            headers = dict(headers or {})
+            headers.setdefault('X-Upyun-Multi-Type', guess_content_type(path))
+            uploader = self.init_multi_uploader(key, headers=headers,
+                                                part_size=part_size,
+                                                file_size=file_size,
+                                                workers=workers)
+            return uploader.upload_from(f, workers=workers, retries=retries,
+                                        checksum=checksum)
+
+    def put_from_url(self, key, url, workers=DEFAULT_WORKERS,
+                     part_size=None, headers=None, retries=None):
+        try:
+            resp = self.hp.session.get(url, stream=True,
+                                       timeout=self.requests_timeout)
+        except requests.exceptions.RequestException as e:
+            raise UpYunClientException(e)
+        if resp.status_code // 100 != 2:
+            resp.close()
+            raise UpYunClientException(
+                'source responded %d: %s' % (resp.status_code, url))
+        return self.__put_stream(key, resp, workers, part_size, headers,
+                                 retries)
+
+    def transfer(self, src_client, src_key, dst_key, workers=DEFAULT_WORKERS,
+                 part_size=None, headers=None, retries=None):
+        resp = src_client.up_rest.get_stream(src_key)
+        return self.__put_stream(dst_key, resp, workers, part_size, headers,
+                                 retries)
+
+    def __put_stream(self, key, resp, workers, part_size, headers, retries):
+        headers = dict(headers or {})
+        content_type = resp.headers.get('Content-Type')
+        try:
+            length = get_fileobj_size(resp)
+            if length is None or length <= (part_size or PART_SIZE):
+                if content_type:
+                    headers.setdefault('Content-Type', content_type)
+                return self.put(key, resp, headers=headers)
+
+            headers.setdefault('X-Upyun-Multi-Type',
+                               content_type or guess_content_type(key))
+            uploader = self.init_multi_uploader(key, headers=headers,
+                                                part_size=part_size,
+                                                file_size=length,
+                                                workers=workers)
+            # 分块请求体由 http 层按上传限速发送, 读取时不再限速
+            body = UploadObject(resp, chunksize=self.chunksize)
+            return uploader.upload_from(body, workers=workers,
+                                        retries=retries)
+        finally:
+            resp.close()
+
+    def get(self, key, value=None, handler=None, params=None,
+            workers=None, part_size=None, checksum=False,
+            need_resume=False, store=None):
+        return self.up_rest.get(key, value, handler, params,
+                                workers, part_size, checksum,
+                                need_resume, store)
+
+    def delete(self, key, async_delete=False):
+        self.up_rest.delete(key, async_delete)
+
+    def delete_many(self, keys, workers=DEFAULT_WORKERS, async_delete=False):
+        return self.up_rest.delete_many(keys, workers, async_delete)
 
     def mkdir(self, key):
         self.up_rest.mkdir(key)
@@ -135,12 +227,34 @@ class UpYun(object):
                  begin=None):
         return self.up_rest.iterlist(key, limit, order, begin)
 
+    def walk(self, key='/', workers=DEFAULT_WORKERS, limit=None, order=None):
+        return self.up_rest.walk(key, workers, limit, order)
+
     def getinfo(self, key):
         return self.up_rest.getinfo(key)
 
+    def getinfo_many(self, keys, workers=DEFAULT_WORKERS, cache=None):
+        return self.up_rest.getinfo_many(keys, workers, cache)
+
+    def sync(self, local_dir, remote_prefix, direction='upload',
+             workers=DEFAULT_WORKERS, delete=False, checksum=False,
+             store=None):
+        syncer = UpYunSync(self, local_dir, remote_prefix, workers=workers,
+                           delete=delete, checksum=checksum, store=store)
+        if direction == 'upload':
+            return syncer.upload()
+        elif direction == 'download':
+            return syncer.download()
+        raise UpYunClientException('direction should be upload or download')
+
     def purge(self, keys, domain=None):
         return self.up_rest.purge(keys, domain)
 
+    def purge_queue(self, domain=None, batch_size=PURGE_BATCH_SIZE,
+                    workers=DEFAULT_WORKERS, rate=None, window=PURGE_WINDOW):
+        return PurgeQueue(self.up_rest, domain, batch_size, workers, rate,
+                          window)
+
     # --- video pretreatment API
     def pretreat(self, tasks, source, notify_url=''):
         return self.av.pretreat(tasks, source, notify_url)